@@ -0,0 +1,48 @@
+"""
+Size and speed of the binary serialization (to_bytes/from_bytes) against JSON
+(to_json/from_json) with each installed JSON backend
+"""
+import sys
+import timeit
+
+import pyqremis
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def _time(fn, setup, repeat):
+    # Fresh input each run, so no serialization caches are hit
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        t = timeit.timeit(lambda: fn(arg), number=1)
+        best = t if best is None else min(best, t)
+    return best
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+
+    def fresh():
+        return QremisRoot.from_dict(d, validate=False)
+
+    print("entities: {}".format(n * 3))
+    b = fresh().to_bytes()
+    encode = _time(lambda x: x.to_bytes(), fresh, repeat)
+    decode = _time(QremisRoot.from_bytes, lambda: b, repeat)
+    print("{:8} {:9} bytes  encode {:.4f}s  decode {:.4f}s".format(
+        "binary", len(b), encode, decode
+    ))
+    for backend in sorted(pyqremis._json_backends):
+        pyqremis.set_json_backend(backend)
+        j = fresh().to_json()
+        encode = _time(lambda x: x.to_json(), fresh, repeat)
+        decode = _time(QremisRoot.from_json, lambda: j, repeat)
+        print("{:8} {:9} bytes  encode {:.4f}s  decode {:.4f}s".format(
+            backend, len(j), encode, decode
+        ))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,35 @@
+"""
+Repeated serialization of an unchanged, and a slightly changed, QremisRoot
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+    root = QremisRoot.from_dict(d)
+    location = root.get_qremis().get_object()[0].get_storage()[0].get_contentLocation()
+
+    def changed():
+        location.set_contentLocationValue('/elsewhere')
+        root.to_json()
+
+    print("entities: {}".format(n * 3))
+    for label, func in [
+        ("from_dict + to_json", lambda: QremisRoot.from_dict(d, validate=False).to_json()),
+        ("to_dict, unchanged (a copy)", root.to_dict),
+        ("to_json, unchanged", root.to_json),
+        ("to_json, one leaf changed", changed),
+        ("to_bytes, unchanged", root.to_bytes),
+        ("to_xml_string, unchanged", root.to_xml_string)
+    ]:
+        func()
+        print("{:32} {:.6f}s".format(label, min(timeit.repeat(func, number=1, repeat=repeat))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,38 @@
+"""
+Validating vs trusted vs lazy construction of a QremisRoot from a dict
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def lookup(root):
+    # The sort of access a lookup style workload makes
+    for o in root.get_qremis().get_object():
+        o.get_objectIdentifier()
+        o.get_objectCategory()
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+    assert QremisRoot.from_dict(d, validate=False).to_dict() == d
+    validating = min(timeit.repeat(lambda: QremisRoot.from_dict(d), number=1, repeat=repeat))
+    trusted = min(timeit.repeat(lambda: QremisRoot.from_dict(d, validate=False),
+                                number=1, repeat=repeat))
+    lazy = min(timeit.repeat(lambda: lookup(QremisRoot.from_dict(d, lazy=True)),
+                             number=1, repeat=repeat))
+    eager = min(timeit.repeat(lambda: lookup(QremisRoot.from_dict(d)),
+                              number=1, repeat=repeat))
+    print("entities:                     {}".format(n * 3))
+    print("from_dict:                    {:.4f}s".format(validating))
+    print("from_dict(validate=False):    {:.4f}s ({:.1f}x faster)".format(
+        trusted, validating / trusted))
+    print("lookup, eager:                {:.4f}s".format(eager))
+    print("lookup, from_dict(lazy=True): {:.4f}s ({:.1f}x faster)".format(lazy, eager / lazy))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,58 @@
+"""
+diff() between a record and a copy with one changed leaf: on fresh trees,
+which have to be digested first, and again after each further change, which
+only rehashes the changed subtrees. __eq__ on fresh trees for scale.
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+from pyqremis.diff import diff, patch
+
+from records import record_dict
+
+
+def _time(fn, setup, repeat):
+    best = None
+    for _ in range(repeat):
+        args = setup()
+        t = timeit.timeit(lambda: fn(*args), number=1)
+        best = t if best is None else min(best, t)
+    return best
+
+
+def fresh(d, n):
+    a = QremisRoot.from_dict(d, validate=False)
+    b = QremisRoot.from_dict(d, validate=False)
+    b.get_qremis().get_object()[n // 2].get_storage()[0].set_storageMedium('tape')
+    return a, b
+
+
+def warm(d, n):
+    a, b = fresh(d, n)
+    diff(a, b)
+    b.get_qremis().get_object()[n // 3].set_originalName('renamed')
+    return a, b
+
+
+def equal(a, b):
+    return a == b
+
+
+def diff_and_patch(a, b):
+    return patch(a, diff(a, b))
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+    print("entities: {}".format(n * 3))
+    print("__eq__, fresh        {:.4f}s".format(_time(equal, lambda: fresh(d, n), repeat)))
+    print("diff, fresh          {:.4f}s".format(_time(diff, lambda: fresh(d, n), repeat)))
+    print("diff, digested       {:.4f}s".format(_time(diff, lambda: warm(d, n), repeat)))
+    print("diff+patch, digested {:.4f}s".format(
+        _time(diff_and_patch, lambda: warm(d, n), repeat)
+    ))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,55 @@
+"""
+Element __eq__ against comparing to_dict() output (the previous implementation),
+on fresh trees which differ by class, early in the tree, or not at all
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot, Object
+
+from records import record_dict, object_dict
+
+
+def _time(fn, setup, repeat):
+    best = None
+    for _ in range(repeat):
+        args = setup()
+        t = timeit.timeit(lambda: fn(*args), number=1)
+        best = t if best is None else min(best, t)
+    return best
+
+
+def to_dict_eq(a, b):
+    try:
+        return a.to_dict() == b.to_dict()
+    except Exception:
+        return False
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+    changed = record_dict(n)
+    changed['qremis']['object'][0] = object_dict(-1)
+    cases = [
+        ("different class", lambda: (
+            QremisRoot.from_dict(d, validate=False),
+            Object.from_dict(object_dict(0), validate=False)
+        )),
+        ("first object differs", lambda: (
+            QremisRoot.from_dict(d, validate=False),
+            QremisRoot.from_dict(changed, validate=False)
+        )),
+        ("equal", lambda: (
+            QremisRoot.from_dict(d, validate=False),
+            QremisRoot.from_dict(d, validate=False)
+        )),
+    ]
+    print("entities: {}".format(n * 3))
+    for name, setup in cases:
+        print("{:22} to_dict {:.4f}s  __eq__ {:.4f}s".format(
+            name, _time(to_dict_eq, setup, repeat), _time(lambda a, b: a == b, setup, repeat)
+        ))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
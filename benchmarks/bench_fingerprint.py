@@ -0,0 +1,53 @@
+"""
+fingerprint() against hashing json.dumps(to_dict(), sort_keys=True), on a fresh
+tree and after changing a single object
+"""
+import json
+import sys
+import timeit
+from hashlib import sha256
+
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def _time(fn, setup, repeat):
+    best = None
+    for _ in range(repeat):
+        arg = setup()
+        t = timeit.timeit(lambda: fn(arg), number=1)
+        best = t if best is None else min(best, t)
+    return best
+
+
+def sorted_json_hash(root):
+    return sha256(json.dumps(root.to_dict(), sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+
+    def fresh():
+        return QremisRoot.from_dict(d, validate=False)
+
+    def changed():
+        # Fingerprinted, then one object changed
+        root = fresh()
+        root.fingerprint()
+        sorted_json_hash(root)
+        root.get_qremis().get_object()[n // 2].set_objectCategory('changed')
+        return root
+
+    print("entities: {}".format(n * 3))
+    print("sorted json  fresh {:.4f}s  after one change {:.4f}s".format(
+        _time(sorted_json_hash, fresh, repeat), _time(sorted_json_hash, changed, repeat)
+    ))
+    print("fingerprint  fresh {:.4f}s  after one change {:.4f}s".format(
+        _time(lambda x: x.fingerprint(), fresh, repeat),
+        _time(lambda x: x.fingerprint(), changed, repeat)
+    ))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
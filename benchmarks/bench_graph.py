@@ -0,0 +1,44 @@
+"""
+"All events linked to an object": scanning every relationship against
+RelationshipGraph.linked()
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+from pyqremis.graph import RelationshipGraph
+
+from records import record_dict
+
+
+def scan(qremis, key):
+    r = []
+    for x in qremis.get_relationship():
+        linked = [
+            (y.get_linkingObjectIdentifierType(), y.get_linkingObjectIdentifierValue())
+            for y in x.get_field('linkingObjectIdentifier')
+        ]
+        if key[1:] in linked:
+            for y in x.get_field('linkingEventIdentifier'):
+                r.append((y.get_linkingEventIdentifierType(), y.get_linkingEventIdentifierValue()))
+    return r
+
+
+def main(n=2000, queries=100, repeat=5):
+    qremis = QremisRoot.from_dict(record_dict(n)).get_qremis()
+    keys = [('object', 'uuid', 'object-{}'.format(i * n // queries)) for i in range(queries)]
+    print("entities: {}, queries: {}".format(n * 3, queries))
+    print("scan         {:.4f}s".format(min(timeit.repeat(
+        lambda: [scan(qremis, k) for k in keys], number=1, repeat=repeat
+    ))))
+    print("build graph  {:.4f}s".format(min(timeit.repeat(
+        lambda: RelationshipGraph([qremis]), number=1, repeat=repeat
+    ))))
+    graph = RelationshipGraph([qremis])
+    print("graph        {:.4f}s".format(min(timeit.repeat(
+        lambda: [graph.linked(k, kind='event') for k in keys], number=1, repeat=repeat
+    ))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
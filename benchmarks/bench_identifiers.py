@@ -0,0 +1,41 @@
+"""
+Finding entities by identifier: Qremis.get_entity_by_identifier() against
+scanning each entity's identifiers
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def scan(qremis, identifierType, identifierValue):
+    for x in qremis.get_object():
+        for identifier in x.get_objectIdentifier():
+            if identifier.get_objectIdentifierType() == identifierType and \
+                    identifier.get_objectIdentifierValue() == identifierValue:
+                return x
+    raise KeyError((identifierType, identifierValue))
+
+
+def main(n=2000, lookups=200, repeat=5):
+    qremis = QremisRoot.from_dict(record_dict(n)).get_qremis()
+    keys = [('uuid', 'object-{}'.format(i * n // lookups)) for i in range(lookups)]
+    print("entities: {}, lookups: {}".format(n * 3, lookups))
+    print("scan             {:.4f}s".format(min(timeit.repeat(
+        lambda: [scan(qremis, *k) for k in keys], number=1, repeat=repeat
+    ))))
+
+    def indexed():
+        qremis._identifier_index = None
+        return [qremis.get_entity_by_identifier(*k) for k in keys]
+
+    print("index, building  {:.4f}s".format(min(timeit.repeat(indexed, number=1, repeat=repeat))))
+    print("index, built     {:.4f}s".format(min(timeit.repeat(
+        lambda: [qremis.get_entity_by_identifier(*k) for k in keys], number=1, repeat=repeat
+    ))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,43 @@
+"""
+"Which objects have this digest": scanning every object's fixity against a
+ValueIndex lookup
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+from pyqremis.index import ValueIndex
+
+from records import record_dict
+
+PATH = 'object.objectCharacteristics.fixity.messageDigest'
+
+
+def scan(qremis, digest):
+    r = []
+    for x in qremis.get_object():
+        for characteristics in x.get_objectCharacteristics():
+            if any(y.get_messageDigest() == digest for y in characteristics.get_field('fixity')):
+                r.append(x)
+                break
+    return r
+
+
+def main(n=2000, queries=100, repeat=5):
+    qremis = QremisRoot.from_dict(record_dict(n)).get_qremis()
+    digests = ['{:032x}'.format(i * n // queries) for i in range(queries)]
+    print("entities: {}, queries: {}".format(n * 3, queries))
+    print("scan         {:.4f}s".format(min(timeit.repeat(
+        lambda: [scan(qremis, x) for x in digests], number=1, repeat=repeat
+    ))))
+    print("build index  {:.4f}s".format(min(timeit.repeat(
+        lambda: ValueIndex([PATH], [qremis]), number=1, repeat=repeat
+    ))))
+    index = ValueIndex([PATH], [qremis])
+    print("index        {:.4f}s".format(min(timeit.repeat(
+        lambda: [index.lookup(PATH, x) for x in digests], number=1, repeat=repeat
+    ))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
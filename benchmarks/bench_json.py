@@ -0,0 +1,26 @@
+"""
+The JSON encoding/decoding behind to_json/from_json, with each installed backend
+"""
+import sys
+import timeit
+
+import pyqremis
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def main(n=2000, repeat=5):
+    root = QremisRoot.from_dict(record_dict(n))
+    d = root.to_dict()
+    print("entities: {}".format(n * 3))
+    for backend in sorted(pyqremis._json_backends):
+        loads, dumps = pyqremis._json_backends[backend]
+        b = dumps(d)
+        encode = min(timeit.repeat(lambda: dumps(d), number=1, repeat=repeat))
+        decode = min(timeit.repeat(lambda: loads(b), number=1, repeat=repeat))
+        print("{:8} dumps {:.4f}s  loads {:.4f}s".format(backend, encode, decode))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,52 @@
+"""
+Fingerprinting every record of a JSON Lines file: in process, and across
+pools of workers which send back only the fingerprints. Also times the part
+of the pool path that stays serial in the parent - reading the lines and
+unpickling the results - which bounds the speedup more cores can give.
+"""
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+from pyqremis import Qremis
+from pyqremis.streaming import load_jsonl, _iter_chunks
+
+from records import event_dict, object_dict
+
+
+def main(n=20000, chunksize=500):
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+        for i in range(n):
+            f.write(json.dumps({'object': [object_dict(i)], 'event': [event_dict(i)]}))
+            f.write("\n")
+    try:
+        print("lines: {}, cores: {}".format(n, os.cpu_count()))
+        start = time.perf_counter()
+        count = sum(1 for _ in load_jsonl(f.name, chunksize=chunksize))
+        assert count == n
+        print("elements, in process     {:.4f}s".format(time.perf_counter() - start))
+        for workers in sorted(set([1, 2, 4, os.cpu_count()])):
+            start = time.perf_counter()
+            results = list(load_jsonl(f.name, chunksize=chunksize, workers=workers,
+                                      func=Qremis.fingerprint))
+            assert len(results) == n
+            print("fingerprints, workers={:<3}{:.4f}s".format(
+                workers, time.perf_counter() - start
+            ))
+        pickled = [pickle.dumps(x) for x in _iter_chunks(results, chunksize)]
+        start = time.perf_counter()
+        with open(f.name, "r") as lines:
+            for _ in _iter_chunks(lines, chunksize):
+                pass
+        for x in pickled:
+            pickle.loads(x)
+        print("serial in the parent     {:.4f}s".format(time.perf_counter() - start))
+    finally:
+        os.remove(f.name)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
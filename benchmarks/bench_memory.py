@@ -0,0 +1,29 @@
+"""
+Memory used by a large QremisRoot, compared to its source JSON
+"""
+import json
+import sys
+import tracemalloc
+
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def main(n=10000):
+    d = record_dict(n)
+    json_size = len(json.dumps(d).encode("utf-8"))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    root = QremisRoot.from_dict(d)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("entities:        {}".format(n * 3))
+    print("source JSON:     {:,} bytes".format(json_size))
+    print("QremisRoot:      {:,} bytes ({:.2f}x JSON)".format(
+        after - before, (after - before) / json_size))
+    return root
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,61 @@
+"""
+Merging overlapping records: checking each entity against everything merged
+so far, against pyqremis.merge.merge in memory and spilling to disk
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+from pyqremis.merge import merge
+
+from records import object_dict, event_dict, relationship_dict
+
+
+def overlapping_records(n, records):
+    # records records of n of each entity, each half overlapping the last
+    r = []
+    for k in range(records):
+        start = k * n // 2
+        r.append(QremisRoot.from_dict({'qremis': {
+            'object': [object_dict(i) for i in range(start, start + n)],
+            'event': [event_dict(i) for i in range(start, start + n)],
+            'relationship': [relationship_dict(i) for i in range(start, start + n)]
+        }}, validate=False))
+    return r
+
+
+def scan(records):
+    # Keeps the first of every entity, looking for its identifiers among
+    # everything kept so far
+    kept = {'object': [], 'event': [], 'relationship': []}
+    for record in records:
+        qremis = record.get_qremis()
+        for kind in kept:
+            for x in qremis.get_field(kind):
+                keys = set(
+                    (y.get_field(kind + 'IdentifierType'), y.get_field(kind + 'IdentifierValue'))
+                    for y in x.get_field(kind + 'Identifier')
+                )
+                if not any(keys & y for y, _ in kept[kind]):
+                    kept[kind].append((keys, x))
+    return kept
+
+
+def main(n=500, records=8, repeat=3):
+    inputs = overlapping_records(n, records)
+    print("entities in: {}, out: {}".format(
+        n * 3 * records, len(list(merge(inputs).to_dict().values())[0]) * 3
+    ))
+    print("scan             {:.4f}s".format(min(timeit.repeat(
+        lambda: scan(inputs), number=1, repeat=repeat
+    ))))
+    print("merge            {:.4f}s".format(min(timeit.repeat(
+        lambda: merge(inputs), number=1, repeat=repeat
+    ))))
+    print("merge, spilling  {:.4f}s".format(min(timeit.repeat(
+        lambda: merge(inputs, spill=True), number=1, repeat=repeat
+    ))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,47 @@
+"""
+Every contentLocationValue in a record: nested loops over get_field against
+a compiled Query, on elements and on the raw dict
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot
+from pyqremis.query import Query
+
+from records import record_dict
+
+
+def nested_loops(qremis):
+    r = []
+    for x in qremis.get_field('object'):
+        try:
+            storages = x.get_field('storage')
+        except KeyError:
+            continue
+        for storage in storages:
+            try:
+                location = storage.get_field('contentLocation')
+                r.append(location.get_field('contentLocationValue'))
+            except KeyError:
+                continue
+    return r
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+    qremis = QremisRoot.from_dict(d).get_qremis()
+    query = Query('object[*].storage[*].contentLocation.contentLocationValue')
+    print("entities: {}".format(n * 3))
+    print("nested loops    {:.4f}s".format(min(timeit.repeat(
+        lambda: nested_loops(qremis), number=1, repeat=repeat
+    ))))
+    print("query           {:.4f}s".format(min(timeit.repeat(
+        lambda: list(query(qremis)), number=1, repeat=repeat
+    ))))
+    print("query, on dict  {:.4f}s".format(min(timeit.repeat(
+        lambda: list(query(d['qremis'])), number=1, repeat=repeat
+    ))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
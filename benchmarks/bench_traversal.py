@@ -0,0 +1,78 @@
+"""
+The iterative to_dict/to_xml_element vs recursive equivalents, on wide and deep trees
+"""
+import sys
+import timeit
+import xml.etree.ElementTree as ET
+
+from pyqremis import ObjectExtension, QremisElement, QremisRoot
+
+from records import record_dict
+
+
+def recursive_to_dict(element):
+    r = {}
+    for x, v in element._iter_fields():
+        if isinstance(v, (list, set, tuple)):
+            r[x] = [recursive_to_dict(y) if isinstance(y, QremisElement) else y for y in v]
+        elif isinstance(v, QremisElement):
+            r[x] = recursive_to_dict(v)
+        else:
+            r[x] = v
+    return r
+
+
+def recursive_to_xml_element(element):
+    e = ET.Element(element._xml_tag)
+    for x, v in element._iter_fields():
+        if not isinstance(v, (list, set, tuple)):
+            v = (v,)
+        for y in v:
+            if isinstance(y, QremisElement):
+                e.append(recursive_to_xml_element(y))
+            else:
+                ET.SubElement(e, x).text = y
+    return e
+
+
+def deep_tree(depth):
+    # Extensions nested inside of extensions, as partner payloads can be
+    e = ObjectExtension(leaf='x')
+    for _ in range(depth):
+        e = ObjectExtension.construct(child=e, note='y')
+    return e
+
+
+def _time(fn, setup, repeat):
+    # Best of repeat runs, each on a freshly built tree so nothing is cached
+    best = None
+    for _ in range(repeat):
+        tree = setup()
+        t = timeit.timeit(lambda: fn(tree), number=1)
+        best = t if best is None else min(best, t)
+    return best
+
+
+def compare(name, setup, repeat):
+    for label, iterative, recursive in [
+        ("to_dict", lambda tree: tree.to_dict(), recursive_to_dict),
+        ("to_xml_element", lambda tree: tree.to_xml_element(), recursive_to_xml_element)
+    ]:
+        it = _time(iterative, setup, repeat)
+        try:
+            rec = "{:.4f}s".format(_time(recursive, setup, repeat))
+        except RecursionError:
+            rec = "RecursionError"
+        print("{:22} {:15} iterative {:.4f}s  recursive {}".format(name, label, it, rec))
+
+
+def main(n=2000, depth=300, repeat=5):
+    d = record_dict(n)
+    compare("wide ({} entities)".format(n * 3),
+            lambda: QremisRoot.from_dict(d, validate=False), repeat)
+    compare("deep ({} levels)".format(depth), lambda: deep_tree(depth), repeat)
+    compare("deep ({} levels)".format(depth * 30), lambda: deep_tree(depth * 30), repeat)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
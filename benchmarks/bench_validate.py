@@ -0,0 +1,32 @@
+"""
+Validating while building (from_dict) against building with checks deferred
+and then collecting every error with validate(), and against validate_dict(),
+which builds nothing
+"""
+import sys
+import timeit
+
+from pyqremis import QremisRoot, validate_dict
+
+from records import record_dict
+
+
+def main(n=2000, repeat=5):
+    d = record_dict(n)
+    print("entities: {}".format(n * 3))
+    print("from_dict(validate=True)               {:.4f}s".format(min(timeit.repeat(
+        lambda: QremisRoot.from_dict(d), number=1, repeat=repeat
+    ))))
+    print("from_dict(validate='defer').validate() {:.4f}s".format(min(timeit.repeat(
+        lambda: QremisRoot.from_dict(d, validate="defer").validate(), number=1, repeat=repeat
+    ))))
+    print("from_dict(validate=False).validate()   {:.4f}s".format(min(timeit.repeat(
+        lambda: QremisRoot.from_dict(d, validate=False).validate(), number=1, repeat=repeat
+    ))))
+    print("validate_dict()                        {:.4f}s".format(min(timeit.repeat(
+        lambda: validate_dict(d), number=1, repeat=repeat
+    ))))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,46 @@
+"""
+Writing XML via an ElementTree vs write_xml
+"""
+import sys
+import timeit
+import tracemalloc
+import xml.etree.ElementTree as ET
+from io import BytesIO
+
+from pyqremis import QremisRoot
+
+from records import record_dict
+
+
+def via_element_tree(root):
+    f = BytesIO()
+    ET.ElementTree(root.to_xml_element()).write(f)
+    return f
+
+
+def via_write_xml(root):
+    f = BytesIO()
+    root.write_xml(f)
+    return f
+
+
+def peak_memory(func, root):
+    tracemalloc.start()
+    f = func(root)
+    peak = tracemalloc.get_traced_memory()[1] - len(f.getvalue())
+    tracemalloc.stop()
+    return peak
+
+
+def main(n=2000, repeat=5):
+    root = QremisRoot.from_dict(record_dict(n))
+    assert via_element_tree(root).getvalue() == via_write_xml(root).getvalue()
+    print("entities: {}".format(n * 3))
+    for func in (via_element_tree, via_write_xml):
+        elapsed = min(timeit.repeat(lambda: func(root), number=1, repeat=repeat))
+        print("{:17} {:.4f}s, {:,} bytes peak excluding output".format(
+            func.__name__, elapsed, peak_memory(func, root)))
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,87 @@
+"""
+Synthetic qremis records for the benchmarks
+"""
+
+
+def object_dict(i, n_links=4):
+    return {
+        'objectIdentifier': [
+            {'objectIdentifierType': 'uuid', 'objectIdentifierValue': 'object-{}'.format(i)}
+        ],
+        'objectCategory': 'file',
+        'originalName': 'file-{}.txt'.format(i),
+        'objectCharacteristics': [
+            {
+                'size': str(i * 1024),
+                'fixity': [
+                    {'messageDigestAlgorithm': 'md5',
+                     'messageDigest': '{:032x}'.format(i)},
+                    {'messageDigestAlgorithm': 'sha256',
+                     'messageDigest': '{:064x}'.format(i)}
+                ],
+                'format': [{'formatDesignation': {'formatName': 'text/plain'}}]
+            }
+        ],
+        'storage': [
+            {
+                'contentLocation': {
+                    'contentLocationType': 'path',
+                    'contentLocationValue': '/archive/{}/{}'.format(i % 100, i)
+                },
+                'storageMedium': 'disk'
+            }
+        ],
+        'linkingRelationshipIdentifier': [
+            {
+                'linkingRelationshipIdentifierType': 'uuid',
+                'linkingRelationshipIdentifierValue': 'relationship-{}-{}'.format(i, j)
+            } for j in range(n_links)
+        ]
+    }
+
+
+def event_dict(i, n_links=4):
+    return {
+        'eventIdentifier': [
+            {'eventIdentifierType': 'uuid', 'eventIdentifierValue': 'event-{}'.format(i)}
+        ],
+        'eventType': ['ingest', 'fixity check', 'migration'][i % 3],
+        'eventDateTime': '2017-01-01T00:00:{:02d}'.format(i % 60),
+        'eventOutcomeInformation': [{'eventOutcome': 'success'}],
+        'linkingRelationshipIdentifier': [
+            {
+                'linkingRelationshipIdentifierType': 'uuid',
+                'linkingRelationshipIdentifierValue': 'relationship-{}-{}'.format(i, j)
+            } for j in range(n_links)
+        ]
+    }
+
+
+def relationship_dict(i, j=0):
+    return {
+        'relationshipIdentifier': [
+            {'relationshipIdentifierType': 'uuid',
+             'relationshipIdentifierValue': 'relationship-{}-{}'.format(i, j)}
+        ],
+        'relationshipType': 'link',
+        'relationshipSubType': 'objectToEvent',
+        'linkingObjectIdentifier': [
+            {'linkingObjectIdentifierType': 'uuid',
+             'linkingObjectIdentifierValue': 'object-{}'.format(i)}
+        ],
+        'linkingEventIdentifier': [
+            {'linkingEventIdentifierType': 'uuid',
+             'linkingEventIdentifierValue': 'event-{}'.format(i)}
+        ]
+    }
+
+
+def record_dict(n=1000):
+    # A QremisRoot shaped dict with n objects, n events and n relationships
+    return {
+        'qremis': {
+            'object': [object_dict(i) for i in range(n)],
+            'event': [event_dict(i) for i in range(n)],
+            'relationship': [relationship_dict(i) for i in range(n)]
+        }
+    }
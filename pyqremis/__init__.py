@@ -1,14 +1,83 @@
 """
 pyqremis
 """
+import json
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
 from functools import partial
+from hashlib import sha256
 from inspect import getmro
+from operator import itemgetter
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
 
 __author__ = "Brian Balsamo"
 __email__ = "brian@brianbalsamo.com"
 __version__ = "0.0.3"
 
 
+def _json_loads(b):
+    # json.loads only takes bytes from 3.6 on
+    if isinstance(b, bytes):
+        b = b.decode("utf-8")
+    return json.loads(b)
+
+
+# name -> (loads, dumps), where loads accepts bytes and dumps returns bytes.
+# Every backend produces the same compact UTF-8 output.
+_json_backends = {
+    'json': (
+        _json_loads,
+        lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    )
+}
+if ujson is not None:
+    _json_backends['ujson'] = (
+        ujson.loads,
+        lambda obj: ujson.dumps(
+            obj, ensure_ascii=False, escape_forward_slashes=False
+        ).encode("utf-8")
+    )
+if orjson is not None:
+    _json_backends['orjson'] = (orjson.loads, orjson.dumps)
+
+# The backend to_json/from_json use - the fastest one that's installed
+_json_backend = _json_backends.get('orjson') or _json_backends.get('ujson') or \
+    _json_backends['json']
+
+
+def register_json_backend(name, loads, dumps):
+    # loads must accept bytes, dumps must return (compact) bytes
+    _json_backends[name] = (loads, dumps)
+
+
+def set_json_backend(name):
+    global _json_backend
+    try:
+        _json_backend = _json_backends[name]
+    except KeyError:
+        raise ValueError(
+            "Unknown JSON backend {} - available: {}".format(
+                name, ", ".join(sorted(_json_backends))
+            )
+        )
+
+
+def get_json_backend():
+    for name, backend in _json_backends.items():
+        if backend is _json_backend:
+            return name
+
+
 def lowerFirst(s):
     if not s:
         return s
@@ -23,37 +92,786 @@ def iter_wrap(thing, callback):
     return callback(thing)
 
 
-class QremisElement:
+def _make_getter(fieldname):
+    def getter(self):
+        return self.get_field(fieldname)
+    return getter
+
+
+def _make_setter(fieldname, _type, repeatable):
+    def setter(self, fieldvalue):
+        self.set_field(fieldname, fieldvalue, _type=_type, repeatable=repeatable)
+    return setter
+
+
+def _make_deller(fieldname):
+    def deller(self, index=None):
+        self.del_field(fieldname, index=index)
+    return deller
+
+
+def _make_adder(fieldname, _type):
+    def adder(self, fieldvalue):
+        self.add_to_field(fieldname, fieldvalue, _type=_type)
+    return adder
+
+
+def _type_error(fieldname, fieldvalue, _type):
+    return TypeError(
+        "Attempted to set {} to a value that is {}, not {}".format(
+            fieldname, str(type(fieldvalue)), str(_type)
+        )
+    )
+
+
+# Stands in for empty slots
+_unset = object()
+
+
+def _init_bookkeeping(element):
+    # Every way of creating an element goes through here (or, in generated
+    # code, does the same thing inline)
+    element._lazy = None
+    element._parent = None
+    element._text_cache = None
+    element._frozen = False
+
+
+def _adopt(parent, child):
+    # Records parent as one of child's parents, so changes to child can
+    # invalidate the caches of everything above it. An element which has been
+    # added in more than one place keeps a list of its parents.
+    p = child._parent
+    if p is None or p is parent:
+        child._parent = parent
+    elif p.__class__ is list:
+        for x in p:
+            if x is parent:
+                return
+        p.append(parent)
+    else:
+        child._parent = [p, parent]
+
+
+class _FieldList(list):
+    # The values of a repeatable field. get_$x() hands out the list itself,
+    # so changing it in place is allowed - and, as with add_to_field, drops
+    # the caches of its element and everything above it, and adopts any
+    # elements added. Pickles and copies as a plain list. Read only once the
+    # element is frozen.
+    __slots__ = ('_owner',)
+
+    def _changed(self, values=()):
+        owner = self._owner
+        for y in values:
+            if isinstance(y, QremisElement):
+                _adopt(owner, y)
+        owner._invalidate()
+
+    def __reduce_ex__(self, protocol):
+        return (list, (list(self),))
+
+    def __setitem__(self, index, value):
+        self._owner._check_mutable()
+        if isinstance(index, slice):
+            value = list(value)
+            list.__setitem__(self, index, value)
+            self._changed(value)
+        else:
+            list.__setitem__(self, index, value)
+            self._changed((value,))
+
+    def __delitem__(self, index):
+        self._owner._check_mutable()
+        list.__delitem__(self, index)
+        self._changed()
+
+    def __iadd__(self, values):
+        self.extend(values)
+        return self
+
+    def __imul__(self, n):
+        self._owner._check_mutable()
+        list.__imul__(self, n)
+        self._changed()
+        return self
+
+    def append(self, value):
+        self._owner._check_mutable()
+        list.append(self, value)
+        self._changed((value,))
+
+    def extend(self, values):
+        self._owner._check_mutable()
+        values = list(values)
+        list.extend(self, values)
+        self._changed(values)
+
+    def insert(self, index, value):
+        self._owner._check_mutable()
+        list.insert(self, index, value)
+        self._changed((value,))
+
+    def pop(self, index=-1):
+        self._owner._check_mutable()
+        value = list.pop(self, index)
+        self._changed()
+        return value
+
+    def remove(self, value):
+        self._owner._check_mutable()
+        list.remove(self, value)
+        self._changed()
+
+    def clear(self):
+        self._owner._check_mutable()
+        list.clear(self)
+        self._changed()
+
+    def sort(self, *args, **kwargs):
+        self._owner._check_mutable()
+        list.sort(self, *args, **kwargs)
+        self._changed()
+
+    def reverse(self):
+        self._owner._check_mutable()
+        list.reverse(self)
+        self._changed()
+
+
+def _field_list(owner, values):
+    # values, as the _FieldList of a field of owner
+    v = _FieldList(values)
+    v._owner = owner
+    return v
+
+
+# tag -> class, for every element class
+_element_classes = {}
+
+
+# (class, validate) -> generated from_dict function
+_decoders = {}
+
+
+def _compile_decoder(cls, validate):
+    # Generates a from_dict function specialized to cls: straight line code
+    # for each field in its _spec, calling the (also generated) decoders of
+    # child classes directly. With validate the checks are the same as
+    # __init__ makes.
+    namespace = {
+        'cls': cls,
+        'new': cls.__new__,
+        'check_fields': cls._check_fields,
+        'type_error': _type_error,
+        'field_list': _FieldList
+    }
+    lines = ["def from_dict(d):"]
+    if validate:
+        lines.extend([
+            "    if len(d) == 0:",
+            "        raise ValueError('No empty elements!')",
+            "    check_fields(d)"
+        ])
+    lines.extend([
+        "    self = new(cls)",
+        "    self._lazy = None",
+        "    self._parent = None",
+        "    self._text_cache = None",
+        "    self._frozen = False"
+    ])
+    for i, x in enumerate(cls._field_types):
+        _type = cls._field_types[x]
+        namespace['type_{}'.format(i)] = _type
+        if isinstance(_type, QremisElementMeta):
+            namespace['decode_{}'.format(i)] = _type._decoder(validate)
+        lines.extend([
+            "    if {!r} in d:".format(x),
+            "        v = d[{!r}]".format(x)
+        ])
+        if x in cls._repeatable_fields:
+            if isinstance(_type, QremisElementMeta):
+                lines.extend([
+                    "        v = field_list([decode_{}(y) for y in v])".format(i),
+                    "        for y in v:",
+                    "            y._parent = self"
+                ])
+            else:
+                lines.append("        v = field_list(v)")
+                if validate:
+                    lines.extend([
+                        "        for y in v:",
+                        "            if not isinstance(y, type_{}):".format(i),
+                        "                raise type_error({!r}, y, type_{})".format(x, i)
+                    ])
+            lines.append("        v._owner = self")
+            if validate:
+                # An empty list satisfies the mandatory check but
+                # doesn't populate the field, same as __init__
+                lines.append("        if v:")
+                lines.append("            setattr(self, {!r}, v)".format(cls._slot_names[x]))
+                continue
+        elif isinstance(_type, QremisElementMeta):
+            lines.append("        v = decode_{}(v)".format(i))
+            lines.append("        v._parent = self")
+        elif validate:
+            lines.extend([
+                "        if not isinstance(v, type_{}):".format(i),
+                "            raise type_error({!r}, v, type_{})".format(x, i)
+            ])
+        lines.append("        setattr(self, {!r}, v)".format(cls._slot_names[x]))
+    lines.append("    return self")
+    exec("\n".join(lines), namespace)
+    return namespace['from_dict']
+
+
+# class -> generated dict checking function
+_dict_checkers = {}
+
+
+def _compile_dict_checker(cls):
+    # Generates a function answering whether a dict tree is valid for cls,
+    # and nothing more: straight line code for each field in its _spec,
+    # returning False at the first problem, calling the (also generated)
+    # checkers of child classes directly. validate_dict() uses it so valid
+    # input never pays for finding and describing errors.
+    namespace = {
+        'dict': dict,
+        'sequences': (list, tuple),
+        'missing': _unset,
+        'known': frozenset(cls._field_types)
+    }
+    lines = [
+        "def check(d):",
+        "    if not isinstance(d, dict) or not d or not d.keys() <= known:",
+        "        return False"
+    ]
+    for i, x in enumerate(cls._field_types):
+        _type = cls._field_types[x]
+        namespace['type_{}'.format(i)] = _type
+        if isinstance(_type, QremisElementMeta):
+            namespace['check_{}'.format(i)] = _type._dict_checker()
+        lines.append("    v = d.get({!r}, missing)".format(x))
+        if x in cls._mandatory_fields:
+            if x in cls._repeatable_fields:
+                lines.append("    if v is missing or not v:")
+            else:
+                lines.append("    if v is missing:")
+            lines.append("        return False")
+        lines.append("    if v is not missing:")
+        if x in cls._repeatable_fields:
+            lines.extend([
+                "        if not isinstance(v, sequences):",
+                "            return False",
+                "        for y in v:"
+            ])
+            if isinstance(_type, QremisElementMeta):
+                lines.append("            if not check_{}(y):".format(i))
+            else:
+                lines.append("            if not isinstance(y, type_{}):".format(i))
+            lines.append("                return False")
+        else:
+            if isinstance(_type, QremisElementMeta):
+                lines.append("        if not check_{}(v):".format(i))
+            else:
+                lines.append("        if not isinstance(v, type_{}):".format(i))
+            lines.append("            return False")
+    lines.append("    return True")
+    exec("\n".join(lines), namespace)
+    return namespace['check']
+
+
+def _deferred_child(stack, kls, d):
+    # A child element for _from_dict_deferred, left on the stack to be
+    # filled in unless it's valid
+    if kls._dict_checker()(d):
+        return kls._decoder(False)(d)
+    y = kls._blank()
+    stack.append((y, d))
+    return y
+
+
+# class -> generated element checking function
+_element_checkers = {}
+
+
+def _compile_element_checker(cls):
+    # Generates a function answering whether an element of cls and
+    # everything below it is valid, as the _dict_checker does for dicts:
+    # straight line code over the slots, returning False at the first
+    # problem. validate() uses it so valid trees never pay for the walk
+    # which describes errors. Elements of subclasses, and those with raw
+    # values outside of their slots, are left to that walk.
+    namespace = {
+        'missing': _unset,
+        'sequences': (list, set, tuple)
+    }
+    lines = [
+        "def check(node):",
+        "    if node._lazy is not None:",
+        "        return False",
+        "    empty = True"
+    ]
+    for i, x in enumerate(cls._field_types):
+        _type = cls._field_types[x]
+        namespace['type_{}'.format(i)] = _type
+        if isinstance(_type, QremisElementMeta):
+            namespace['check_{}'.format(i)] = _type._element_checker()
+            bad = "y.__class__ is not type_{0} or not check_{0}(y)".format(i)
+        else:
+            bad = "not isinstance(y, type_{})".format(i)
+        lines.append("    v = getattr(node, {!r}, missing)".format(cls._slot_names[x]))
+        if x in cls._repeatable_fields:
+            lines.extend([
+                "    if v is not missing:",
+                "        if not isinstance(v, list):",
+                "            return False",
+                "        if v:",
+                "            empty = False",
+                "            for y in v:",
+                "                if {}:".format(bad),
+                "                    return False"
+            ])
+            if x in cls._mandatory_fields:
+                # An empty list is the same as an absent field
+                lines.append("    if v is missing or not v:")
+                lines.append("        return False")
+        else:
+            if x in cls._mandatory_fields:
+                lines.append("    if v is missing:")
+                lines.append("        return False")
+            lines.extend([
+                "    if v is not missing:",
+                "        y = v",
+                "        if isinstance(y, sequences) or {}:".format(bad),
+                "            return False",
+                "        empty = False"
+            ])
+    lines.append("    return not empty")
+    exec("\n".join(lines), namespace)
+    return namespace['check']
+
+
+def _check_freeform_element(node):
+    # The _element_checker of elements outside of the specification
+    if node._lazy is not None or not node._fields:
+        return False
+    for v in node._fields.values():
+        if not isinstance(v, (list, set, tuple)):
+            v = (v,)
+        for y in v:
+            if isinstance(y, QremisElement):
+                if not y._element_checker()(y):
+                    return False
+            elif not isinstance(y, (str, dict)):
+                return False
+    return True
+
+
+def _check_freeform_dict(d):
+    # The _dict_checker of elements outside of the specification
+    if not isinstance(d, dict) or not d:
+        return False
+    for v in d.values():
+        if not isinstance(v, (list, tuple)):
+            return False
+        for y in v:
+            if not isinstance(y, (str, dict)):
+                return False
+    return True
+
+
+class QremisElementMeta(type):
+    # Builds the getters, setters, dellers, adders and properties for every
+    # field in a class's _spec once, when the class is created, rather than
+    # attaching fresh partials to every instance in __init__.
+    # Anything the class body defines itself is left alone.
+    #
+    # Field values live in __slots__ derived from the _spec (one slot per field,
+    # named "_" + the field name, holding a list only for repeatable fields),
+    # so instances carry no __dict__. Classes which don't declare __slots__
+    # themselves get an empty tuple so they don't reintroduce one.
+    #
+    # The _spec is also compiled into frozen lookup tables, which is what the
+    # hot paths consult rather than walking _spec (or the mro of its types)
+    # for every field of every node.
+    def __new__(mcs, name, bases, namespace):
+        spec = namespace.get("_spec")
+        slots = tuple(namespace.get("__slots__", ()))
+        namespace["_xml_tag"] = lowerFirst(name)
+        if spec is not None:
+            inherited = set()
+            for base in bases:
+                for k in getmro(base):
+                    inherited.update(k.__dict__.get("__slots__", ()))
+            namespace["_slot_names"] = dict((x, "_" + x) for x in spec)
+            namespace["_field_types"] = MappingProxyType(
+                dict((x, spec[x]['type']) for x in spec)
+            )
+            namespace["_child_types"] = MappingProxyType(dict(
+                (x, spec[x]['type']) for x in spec
+                if isinstance(spec[x]['type'], QremisElementMeta)
+            ))
+            namespace["_mandatory_fields"] = frozenset(
+                x for x in spec if spec[x]['mandatory'] is True
+            )
+            namespace["_repeatable_fields"] = frozenset(
+                x for x in spec if spec[x]['repeatable'] is True
+            )
+            # Small integer codes standing in for the field names in the
+            # binary format, and the inverse: code -> (fieldname, slot name,
+            # child type or None, repeatable). Assigned in order of name,
+            # not of the _spec dict, which isn't ordered before Python 3.6 -
+            # codes have to be the same in every process.
+            coded = sorted(spec)
+            namespace["_field_codes"] = MappingProxyType(
+                dict((x, i) for i, x in enumerate(coded))
+            )
+            namespace["_fields_by_code"] = tuple(
+                (x, "_" + x,
+                 spec[x]['type'] if isinstance(spec[x]['type'], QremisElementMeta) else None,
+                 spec[x]['repeatable'] is True)
+                for x in coded
+            )
+            slots = slots + tuple(
+                "_" + x for x in spec if "_" + x not in inherited and "_" + x not in slots
+            )
+            for x in spec:
+                accessors = [
+                    ("get_{}".format(x), _make_getter(x)),
+                    ("set_{}".format(x), _make_setter(
+                        x, spec[x]['type'], spec[x]['repeatable'])),
+                    ("del_{}".format(x), _make_deller(x))
+                ]
+                if spec[x]['repeatable']:
+                    accessors.append(("add_{}".format(x), _make_adder(x, spec[x]['type'])))
+                for attr, func in accessors:
+                    func.__name__ = attr
+                    func.__qualname__ = "{}.{}".format(name, attr)
+                    namespace.setdefault(attr, func)
+                namespace.setdefault(x, property(
+                    fget=namespace["get_{}".format(x)],
+                    fset=namespace["set_{}".format(x)],
+                    fdel=namespace["del_{}".format(x)]
+                ))
+        namespace["__slots__"] = slots
+        cls = super().__new__(mcs, name, bases, namespace)
+        _element_classes[cls._xml_tag] = cls
+        # The slots which hold the element's value (see __getstate__)
+        cls._value_slots = tuple(
+            slot for k in reversed(cls.__mro__) for slot in k.__dict__.get("__slots__", ())
+            if slot not in cls._bookkeeping_slots
+        )
+        return cls
+
+
+class QremisElement(metaclass=QremisElementMeta):
+    # _lazy is None, or (validate, pending, rejected) for the raw input values
+    # an element holds outside of its slots: pending is {fieldname: raw value}
+    # for the child element fields of a lazily loaded element which haven't
+    # been touched yet, rejected is None or {fieldname: raw value} for those
+    # from_dict(validate="defer") couldn't use, kept for validate() to report
+    # _parent is None, the element this one is a field value of, or a list
+    # of them if it has been added in more than one place
+    # _text_cache is None or a dict of the cached serializations and digests
+    # _frozen is whether the element (and so everything below it) is read
+    # only, see freeze()
+    __slots__ = ('_lazy', '_parent', '_text_cache', '_frozen')
+    # Slots which aren't part of the element's value (see __getstate__)
+    _bookkeeping_slots = ('_parent', '_text_cache')
+    # Whether the element keeps an _identifier_index (see Qremis)
+    _indexed = False
+
+    # Compiled from _spec by the metaclass
+    # fieldname -> slot name
+    _slot_names = {}
+    # fieldname -> type, for every field
+    _field_types = MappingProxyType({})
+    # fieldname -> QremisElement subclass, for fields holding elements
+    _child_types = MappingProxyType({})
+    _mandatory_fields = frozenset()
+    _repeatable_fields = frozenset()
+    # Whether the element lives outside of the spec, and so its fields
+    # can't be described by the tables above
+    _freeform = False
+
     @classmethod
-    def from_dict(cls, d):
-        if len(d) == 0:
-            raise ValueError("No empty elements!")
-        kwargs = {}
-        for x in d:
-            if x not in cls._spec.keys():
-                raise TypeError("Erroneous field! - {}".format(x))
-            spec = cls._spec[x]
-            if spec['repeatable'] is False:
-                if spec['type'] == str:
-                    kwargs[x] = d[x]
-                elif QremisElement in getmro(spec['type']):
-                    kwargs[x] = spec['type'].from_dict(d[x])
+    def from_dict(cls, d, validate=True, lazy=False):
+        # validate=False is for data which has already been validated
+        # (eg, reloaded from our own store) and skips every check
+        # validate="defer" builds whatever it's given, setting aside the
+        # fields which don't fit the _spec rather than raising, so validate()
+        # can report every problem at once (see _from_dict_deferred)
+        # lazy=True holds on to the raw dicts of child elements and only
+        # builds them when something (a getter, to_dict(), etc) reaches them.
+        # Validation of those children is deferred until then as well.
+        if validate == "defer":
+            if lazy:
+                raise ValueError("validate='defer' can't be lazy")
+            return cls._from_dict_deferred(d)
+        if lazy:
+            return cls._from_dict_lazy(d, validate)
+        return cls._decoder(validate)(d)
+
+    @classmethod
+    def _decoder(cls, validate):
+        # The generated from_dict function for this class, compiled on first use
+        try:
+            return _decoders[cls, validate]
+        except KeyError:
+            decoder = _decoders[cls, validate] = _compile_decoder(cls, validate)
+            return decoder
+
+    @classmethod
+    def _dict_checker(cls):
+        # The generated validity check for dicts of this class, compiled on
+        # first use
+        try:
+            return _dict_checkers[cls]
+        except KeyError:
+            checker = _dict_checkers[cls] = _compile_dict_checker(cls)
+            return checker
+
+    @classmethod
+    def _element_checker(cls):
+        # The generated validity check for elements of this class, compiled
+        # on first use
+        try:
+            return _element_checkers[cls]
+        except KeyError:
+            checker = _element_checkers[cls] = _compile_element_checker(cls)
+            return checker
+
+    @classmethod
+    def _from_dict_deferred(cls, d):
+        # Valid input goes through the generated checker and decoder, and is
+        # known to be valid until it changes (see validate). Anything else is
+        # built depth first, valid subtrees still through those: fields
+        # outside the _spec, values of the wrong shape or type, and element
+        # fields holding anything but dicts are kept, raw, in _lazy's
+        # rejected, so an element has either a usable value for a field or
+        # nothing.
+        if cls._dict_checker()(d):
+            root = cls._decoder(False)(d)
+            root._text_cache = {'valid': True}
+            return root
+        if not isinstance(d, dict):
+            raise _type_error(cls._xml_tag, d, dict)
+        root = cls._blank()
+        stack = [(root, d)]
+        while stack:
+            self, d = stack.pop()
+            rejected = {}
+            if self._freeform:
+                for x, v in d.items():
+                    if isinstance(v, (list, tuple)) and \
+                            all(isinstance(y, (str, dict)) for y in v):
+                        self._fields[x] = _field_list(self, v)
+                    else:
+                        rejected[x] = v
+                if rejected:
+                    self._lazy = (False, {}, rejected)
+                continue
+            slot_names = self._slot_names
+            field_types = self._field_types
+            child_types = self._child_types
+            repeatable_fields = self._repeatable_fields
+            for x, v in d.items():
+                _type = field_types.get(x)
+                if _type is None:
+                    rejected[x] = v
+                elif x in repeatable_fields:
+                    if not isinstance(v, (list, tuple)):
+                        rejected[x] = v
+                    elif not v:
+                        # Same as an absent field, as in __init__
+                        continue
+                    elif x in child_types:
+                        if not all(isinstance(y, dict) for y in v):
+                            rejected[x] = v
+                            continue
+                        values = _field_list(self, [_deferred_child(stack, _type, y) for y in v])
+                        for y in values:
+                            y._parent = self
+                        setattr(self, slot_names[x], values)
+                    elif all(isinstance(y, _type) for y in v):
+                        setattr(self, slot_names[x], _field_list(self, v))
+                    else:
+                        rejected[x] = v
+                elif x in child_types:
+                    if isinstance(v, dict):
+                        y = _deferred_child(stack, _type, v)
+                        y._parent = self
+                        setattr(self, slot_names[x], y)
+                    else:
+                        rejected[x] = v
+                elif isinstance(v, _type):
+                    setattr(self, slot_names[x], v)
                 else:
-                    raise TypeError()
+                    rejected[x] = v
+            if rejected:
+                self._lazy = (False, {}, rejected)
+        return root
+
+    @classmethod
+    def _from_dict_lazy(cls, d, validate):
+        if validate:
+            if len(d) == 0:
+                raise ValueError("No empty elements!")
+            cls._check_fields(d)
+        self = cls._blank()
+        slot_names = cls._slot_names
+        field_types = cls._field_types
+        child_types = cls._child_types
+        repeatable_fields = cls._repeatable_fields
+        pending = {}
+        for x, v in d.items():
+            if x in child_types:
+                pending[x] = v
+            elif x not in slot_names:
+                # Trusted input, so fields outside the _spec are dropped,
+                # as the generated decoder does
+                continue
+            elif validate:
+                if x in repeatable_fields:
+                    for y in v:
+                        self.add_to_field(x, y, _type=field_types[x])
+                else:
+                    self.set_field(x, v, _type=field_types[x])
+            elif x in repeatable_fields:
+                setattr(self, slot_names[x], _field_list(self, v))
             else:
-                kwargs[x] = []
-                for y in d[x]:
-                    if spec['type'] == str:
-                        kwargs[x].append(y)
-                    elif QremisElement in getmro(spec['type']):
-                        kwargs[x].append(spec['type'].from_dict(y))
-                    else:
-                        raise TypeError()
-        return cls(**kwargs)
+                setattr(self, slot_names[x], v)
+        if pending:
+            self._lazy = (validate, pending, None)
+        return self
+
+    def _materialize(self, fieldname):
+        # Build a pending child field of a lazily loaded element
+        validate, pending, _ = self._lazy
+        kls = self._child_types[fieldname]
+        if fieldname in self._repeatable_fields:
+            value = _field_list(
+                self, [kls.from_dict(y, validate=validate, lazy=True) for y in pending[fieldname]]
+            )
+        else:
+            value = kls.from_dict(pending[fieldname], validate=validate, lazy=True)
+        for y in (value if fieldname in self._repeatable_fields else (value,)):
+            y._parent = self
+        setattr(self, self._slot_names[fieldname], value)
+        self._discard_pending(fieldname)
+        return value
+
+    def _materialize_all(self):
+        if self._lazy is not None:
+            for x in list(self._lazy[1]):
+                self._materialize(x)
+
+    def _discard_pending(self, fieldname):
+        # Drops the raw value of a field which has been built, replaced or
+        # deleted
+        if self._lazy is not None:
+            _, pending, rejected = self._lazy
+            pending.pop(fieldname, None)
+            if rejected is not None:
+                rejected.pop(fieldname, None)
+            if not pending and not rejected:
+                self._lazy = None
 
     @classmethod
-    def from_xml_element(cls, e):
-        pass
+    def _check_fields(cls, provided_fields):
+        slot_names = cls._slot_names
+        for x in provided_fields:
+            if x not in slot_names:
+                raise TypeError("Erroneous field! - {}".format(x))
+        missing_fields = cls._mandatory_fields.difference(provided_fields)
+        if missing_fields:
+            raise ValueError(
+                "The following are required for init, but were not present: {}".format(
+                    ", ".join(missing_fields)
+                )
+            )
+
+    @classmethod
+    def _blank(cls):
+        # An instance with no fields populated, bypassing __init__
+        self = cls.__new__(cls)
+        _init_bookkeeping(self)
+        return self
+
+    @classmethod
+    def construct(cls, *args, **kwargs):
+        # Trusted counterpart to __init__: values are stored as given with no
+        # mandatory, erroneous field or type checks. Repeatable fields may be
+        # given either a single value or a list/set/tuple of them.
+        self = cls._blank()
+        repeatable_fields = cls._repeatable_fields
+        for x in args:
+            fieldname = lowerFirst(x.__class__.__name__)
+            if fieldname in repeatable_fields:
+                kwargs.setdefault(fieldname, []).append(x)
+            else:
+                kwargs[fieldname] = x
+        for x, v in kwargs.items():
+            if x in repeatable_fields:
+                if isinstance(v, (list, set, tuple)):
+                    v = _field_list(self, v)
+                else:
+                    v = _field_list(self, (v,))
+                for y in v:
+                    if isinstance(y, QremisElement):
+                        _adopt(self, y)
+            elif isinstance(v, QremisElement):
+                _adopt(self, v)
+            self._set_raw(x, v)
+        return self
+
+    @classmethod
+    def from_xml_element(cls, e, validate=True):
+        # A single pass over e, dispatching on each child's tag (which is the
+        # field name) via the compiled tables.
+        if validate:
+            if e.tag != lowerFirst(cls.__name__):
+                raise ValueError(
+                    "Expected a {} element, got {}".format(lowerFirst(cls.__name__), e.tag)
+                )
+            if len(e) == 0:
+                raise ValueError("No empty elements!")
+        child_types = cls._child_types
+        repeatable_fields = cls._repeatable_fields
+        fields = {}
+        slot_names = cls._slot_names
+        for child in e:
+            x = child.tag
+            if not validate and x not in slot_names:
+                # As from_dict(validate=False), fields outside the _spec are
+                # dropped
+                continue
+            kls = child_types.get(x)
+            if kls is None:
+                value = child.text or ""
+            else:
+                value = kls.from_xml_element(child, validate=validate)
+            if x in repeatable_fields:
+                if x in fields:
+                    fields[x].append(value)
+                else:
+                    fields[x] = [value]
+            elif validate and x in fields:
+                raise ValueError("Non-repeatable field repeated! - {}".format(x))
+            else:
+                fields[x] = value
+        if validate:
+            return cls(**fields)
+        self = cls._blank()
+        for x, value in fields.items():
+            if x in repeatable_fields:
+                value = _field_list(self, value)
+            if x in child_types:
+                for y in (value if x in repeatable_fields else (value,)):
+                    y._parent = self
+            setattr(self, slot_names[x], value)
+        return self
 
     def __init__(self, *args, **kwargs):
         # Structural requirement for child classes
@@ -64,67 +882,201 @@ class QremisElement:
         # Be sure we can build a valid element
         if len(args) == 0 and len(kwargs) == 0:
             raise ValueError("No empty elements!")
-        mandatory_fields = set(x for x in self._spec if self._spec[x]['mandatory'] is True)
-        provided_fields = set(lowerFirst(x.__class__.__name__) for x in args)
-        provided_fields = provided_fields.union(set([x for x in kwargs]))
-        for x in provided_fields:
-            if x not in self._spec:
-                raise TypeError("Erroneous field! - {}".format(x))
-        if not mandatory_fields.issubset(provided_fields):
-            raise ValueError(
-                "The following are required for init, but were not present: {}".format(
-                    ", ".join(mandatory_fields - provided_fields)
-                )
-            )
-
-        # Dynamically build getters, setters, dellers, adders from spec
-        for x in self._spec:
-            setattr(self, "get_{}".format(x), partial(self.get_field, x))
-            setattr(self, "set_{}".format(x),
-                    partial(self.set_field, x, _type=self._spec[x]['type'],
-                            repeatable=self._spec[x]['repeatable']))
-            setattr(self, "del_{}".format(x), partial(self.del_field, x))
-            if self._spec[x]['repeatable']:
-                setattr(
-                    self,
-                    "add_{}".format(x),
-                    partial(self.add_to_field, x, _type=self._spec[x]['type'])
-                )
-
-            # Set the object properties
-            # TODO: Unbreak? Remove?
-            # I think this has something to do with attribute search order?
-            setattr(self, "{}".format(x), property(fget=getattr(self, "get_{}".format(x)),
-                                                   fset=getattr(self, "set_{}".format(x)),
-                                                   fdel=getattr(self, "del_{}".format(x))))
+        field_types = self._field_types
+        repeatable_fields = self._repeatable_fields
+        provided_fields = set(kwargs)
+        provided_fields.update(lowerFirst(x.__class__.__name__) for x in args)
+        self._check_fields(provided_fields)
 
         # Build the element with the init args
-        self._fields = {}
+        _init_bookkeeping(self)
         for x in args:
             if not isinstance(x, QremisElement):
                 raise ValueError("Only QremisElement instance are accepted as args")
-            if self._spec[lowerFirst(x.__class__.__name__)]['repeatable']:
-                getattr(self, "add_{}".format(lowerFirst(x.__class__.__name__)))(x)
+            fieldname = lowerFirst(x.__class__.__name__)
+            if fieldname in repeatable_fields:
+                self.add_to_field(fieldname, x, _type=field_types[fieldname])
             else:
-                getattr(self, "set_{}".format(lowerFirst(x.__class__.__name__)))(x)
-        for x in kwargs:
-            if self._spec[x]['repeatable']:
-                iter_wrap(kwargs[x], getattr(self, "add_{}".format(x)))
+                self.set_field(fieldname, x, _type=field_types[fieldname])
+        for x, value in kwargs.items():
+            if x in repeatable_fields:
+                if isinstance(value, (list, set, tuple)):
+                    for y in value:
+                        self.add_to_field(x, y, _type=field_types[x])
+                else:
+                    self.add_to_field(x, value, _type=field_types[x])
             else:
-                getattr(self, "set_{}".format(x))(kwargs[x])
+                self.set_field(x, value, _type=field_types[x])
 
     def __eq__(self, other):
+        # Structural, stopping at the first difference: elements are equal
+        # when they're of the same class and their fields are. Subtrees which
+        # both have a cached digest are compared by digest first. Iterative,
+        # as to_dict, and in document order, so early differences are found
+        # early.
+        if not isinstance(other, QremisElement):
+            return NotImplemented
+        stack = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if a.__class__ is not b.__class__ and not (
+                isinstance(a, (list, tuple, set)) and isinstance(b, (list, tuple, set))
+            ):
+                return False
+            if isinstance(a, QremisElement):
+                if a._text_cache is not None and b._text_cache is not None:
+                    digest = a._text_cache.get('digest')
+                    if digest is not None and b._text_cache.get('digest', digest) != digest:
+                        return False
+                if a._freeform:
+                    stack.append((a._fields, b._fields))
+                    continue
+                a_fields = list(a._iter_fields())
+                b_fields = list(b._iter_fields())
+                if len(a_fields) != len(b_fields):
+                    return False
+                child_types = a._child_types
+                pending = []
+                for (x, v), (y, w) in zip(a_fields, b_fields):
+                    if x != y:
+                        return False
+                    if x in child_types:
+                        pending.append((v, w))
+                    elif v != w:
+                        # Strings, or lists of them
+                        return False
+                stack.extend(reversed(pending))
+            elif isinstance(a, dict):
+                if a.keys() != b.keys():
+                    return False
+                stack.extend(reversed([(a[x], b[x]) for x in a]))
+            elif isinstance(a, (list, tuple, set)):
+                if len(a) != len(b):
+                    return False
+                stack.extend(reversed(list(zip(a, b))))
+            elif a != b:
+                return False
+        return True
+
+    def __hash__(self):
+        # From the fingerprint, so it's consistent with __eq__ and cached the
+        # same way. Changing an element would change its hash, so only
+        # frozen elements have one.
+        if not self._frozen:
+            raise TypeError(
+                "unhashable type: '{}' (freeze() it first)".format(self.__class__.__name__)
+            )
+        return hash((self._xml_tag, _digest_tree(self, {})))
+
+    def freeze(self):
+        # Makes the element and everything below it read only - set/add/del
+        # and changes to the lists get_$x() returns raise TypeError - and
+        # hashable, for use as dict keys and set members. Returns self.
+        # There's no thawing; from_dict(x.to_dict()) is a changeable copy.
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._frozen:
+                # Nothing can be added below a frozen element
+                continue
+            node._frozen = True
+            for x, v in node._iter_fields():
+                for y in (v if isinstance(v, (list, set, tuple)) else (v,)):
+                    if isinstance(y, QremisElement):
+                        stack.append(y)
+        return self
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise TypeError("Can't change a frozen {}".format(self.__class__.__name__))
+
+    def __getstate__(self):
+        # Parents and caches aren't part of an element's value, and pickling
+        # the parent would drag the whole tree along with any element
+        state = {}
+        for slot in self._value_slots:
+            v = getattr(self, slot, _unset)
+            if v is not _unset:
+                state[slot] = v
+        return state
+
+    def __setstate__(self, state):
+        _init_bookkeeping(self)
+        for slot, v in state.items():
+            if v.__class__ is list:
+                v = _field_list(self, v)
+            setattr(self, slot, v)
+        for x, v in self._iter_fields():
+            for y in (v if isinstance(v, (list, set, tuple)) else (v,)):
+                if isinstance(y, QremisElement):
+                    _adopt(self, y)
+
+    def _invalidate(self):
+        # Drops the cached serializations of this element and everything
+        # above it
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._text_cache = None
+            if node._indexed:
+                node._identifier_index = None
+            parent = node._parent
+            if parent is None:
+                continue
+            if parent.__class__ is list:
+                stack.extend(parent)
+            else:
+                stack.append(parent)
+
+    def _iter_fields(self):
+        # (fieldname, value) for every populated field, in _spec order
+        self._materialize_all()
+        for x, slot in self._slot_names.items():
+            v = getattr(self, slot, _unset)
+            if v is not _unset:
+                yield x, v
+
+    @property
+    def _fields(self):
+        # Read only snapshot of the populated fields, for backwards compatibility
+        return dict(self._iter_fields())
+
+    def _set_raw(self, fieldname, fieldvalue):
         try:
-            return self.to_dict() == other.to_dict()
-        except:
-            return False
+            slot = self._slot_names[fieldname]
+        except KeyError:
+            raise TypeError("Erroneous field! - {}".format(fieldname))
+        setattr(self, slot, fieldvalue)
+        if self._lazy is not None:
+            self._discard_pending(fieldname)
+
+    def _del_raw(self, fieldname):
+        lazy = self._lazy
+        if lazy is not None and lazy[2] is not None and fieldname in lazy[2]:
+            # Rejected fields, unknown ones included, have nothing in a slot
+            self._discard_pending(fieldname)
+            return
+        try:
+            delattr(self, self._slot_names[fieldname])
+        except AttributeError:
+            if lazy is None or fieldname not in lazy[1]:
+                raise KeyError(fieldname)
+        self._discard_pending(fieldname)
 
     def set_field(self, fieldname, fieldvalue, _type=None, repeatable=False):
         # TODO: Handle iters better? Probably need to dig around
         # in collections.abc
+        self._check_mutable()
+        self._invalidate()
         if repeatable:
-            iter_wrap(fieldvalue, partial(self.add_to_field(
-                fieldname, _type=_type, repeatable=repeatable)))
+            # Setting a repeatable field replaces whatever was there
+            try:
+                self._del_raw(fieldname)
+            except KeyError:
+                pass
+            iter_wrap(fieldvalue, partial(self.add_to_field, fieldname, _type=_type))
         else:
             if _type is not None:
                 if not isinstance(fieldvalue, _type):
@@ -133,9 +1085,12 @@ class QremisElement:
                             fieldname, str(type(fieldvalue)), str(_type)
                         )
                     )
-            self._fields[fieldname] = fieldvalue
+            self._set_raw(fieldname, fieldvalue)
+            if isinstance(fieldvalue, QremisElement):
+                _adopt(self, fieldvalue)
 
     def add_to_field(self, fieldname, fieldvalue, _type=None):
+        self._check_mutable()
         if _type is not None:
             if not isinstance(fieldvalue, _type):
                 raise TypeError(
@@ -143,107 +1098,851 @@ class QremisElement:
                         fieldname, str(type(fieldvalue)), str(_type)
                     )
                 )
-        if fieldname not in self._fields:
-            self._fields[fieldname] = []
-        self._fields[fieldname].append(fieldvalue)
+        try:
+            # list.append, as the _FieldList's own would invalidate as well
+            list.append(self.get_field(fieldname), fieldvalue)
+        except KeyError:
+            self._set_raw(fieldname, _field_list(self, (fieldvalue,)))
+        if isinstance(fieldvalue, QremisElement):
+            _adopt(self, fieldvalue)
+        self._invalidate()
 
     def get_field(self, fieldname):
-        return self._fields[fieldname]
+        try:
+            return getattr(self, self._slot_names[fieldname])
+        except AttributeError:
+            if self._lazy is not None and fieldname in self._lazy[1]:
+                return self._materialize(fieldname)
+            raise KeyError(fieldname)
 
     def del_field(self, fieldname, index=None):
         # Dynamically removes empty fields
-        if index:
-            del self._fields[fieldname][index]
-            if len(self._fields[fieldname]) == 0:
-                del self._fields[fieldname]
+        self._check_mutable()
+        self._invalidate()
+        if index is not None:
+            values = self.get_field(fieldname)
+            del values[index]
+            if len(values) == 0:
+                self._del_raw(fieldname)
         else:
-            del self._fields[fieldname]
+            self._del_raw(fieldname)
 
-    def to_dict(self):
-        # TODO:
-        # This doesn't play nicely with iter_wrap unless I change it to two callbacks,
-        # maybe a kwarg like...
-        # iter_callback = None and if iter_callback is None iter_callback=callback
-        r = {}
-        for x in self._fields:
-            if isinstance(self._fields[x], list) or \
-                    isinstance(self._fields[x], set) or \
-                    isinstance(self._fields[x], tuple):
-                r[x] = []
-                for y in self._fields[x]:
-                    if isinstance(y, QremisElement):
-                        r[x].append(y.to_dict())
+    @classmethod
+    def from_json(cls, b, validate=True, lazy=False):
+        return cls.from_dict(_json_backend[0](b), validate=validate, lazy=lazy)
+
+    def to_json(self):
+        # Cached until the element (or anything below it) changes
+        backend = _json_backend
+        text_cache = self._text_cache
+        if text_cache is None:
+            text_cache = self._text_cache = {}
+        else:
+            cached = text_cache.get('json')
+            if cached is not None and cached[0] is backend:
+                return cached[1]
+        b = backend[1](self._dict())
+        text_cache['json'] = (backend, b)
+        return b
+
+    @classmethod
+    def from_bytes(cls, b, validate=True):
+        # The inverse of to_bytes. Field names and types are implied by the
+        # format, so validation is limited to empty elements and missing
+        # mandatory fields.
+        if b[:len(_BINARY_MAGIC)] != _BINARY_MAGIC:
+            raise ValueError("Not a pyqremis binary serialization")
+        tag, pos = _read_str(b, len(_BINARY_MAGIC))
+        if tag != cls._xml_tag:
+            raise ValueError("Expected a {} element, got {}".format(cls._xml_tag, tag))
+        self, pos = cls._decode_binary(b, pos, validate)
+        if pos != len(b):
+            raise ValueError("Trailing data after the {} element".format(tag))
+        return self
+
+    def to_bytes(self):
+        # A compact binary serialization - see _encode_binary. Cached until the
+        # element (or anything below it) changes.
+        if self._text_cache is None:
+            self._text_cache = {}
+        elif 'bytes' in self._text_cache:
+            return self._text_cache['bytes']
+        out = bytearray(_BINARY_MAGIC)
+        _write_str(out, self._xml_tag)
+        self._encode_binary(out)
+        b = self._text_cache['bytes'] = bytes(out)
+        return b
+
+    def _encode_binary(self, out):
+        # The number of populated fields, then for each: its code, then its
+        # value, or the number of values and the values if it's repeatable.
+        # Strings are length prefixed UTF-8, elements are encoded in place.
+        # All integers are varints.
+        fields = list(self._iter_fields())
+        _write_varint(out, len(fields))
+        field_codes = self._field_codes
+        child_types = self._child_types
+        repeatable_fields = self._repeatable_fields
+        for x, v in fields:
+            _write_varint(out, field_codes[x])
+            if x in repeatable_fields:
+                _write_varint(out, len(v))
+            else:
+                v = (v,)
+            if x in child_types:
+                for y in v:
+                    y._encode_binary(out)
+            else:
+                for y in v:
+                    _write_str(out, y)
+
+    @classmethod
+    def _decode_binary(cls, b, pos, validate):
+        # Returns the decoded element and the position after it
+        self = cls._blank()
+        fields_by_code = cls._fields_by_code
+        n, pos = _read_varint(b, pos)
+        if validate:
+            if n == 0:
+                raise ValueError("No empty elements!")
+            provided_fields = set()
+        for _ in range(n):
+            code, pos = _read_varint(b, pos)
+            try:
+                x, slot, kls, repeatable = fields_by_code[code]
+            except IndexError:
+                raise ValueError("Unknown field code {} for {}".format(code, cls._xml_tag))
+            if validate:
+                # Every value of a field is written under one code, so a
+                # second one would replace the first
+                if x in provided_fields:
+                    raise ValueError("Field repeated! - {}".format(x))
+                provided_fields.add(x)
+            if repeatable:
+                count, pos = _read_varint(b, pos)
+                v = _field_list(self, ())
+                for _ in range(count):
+                    if kls is None:
+                        y, pos = _read_str(b, pos)
                     else:
-                        r[x].append(y)
+                        y, pos = kls._decode_binary(b, pos, validate)
+                        y._parent = self
+                    list.append(v, y)
+            elif kls is None:
+                v, pos = _read_str(b, pos)
             else:
-                if isinstance(self._fields[x], QremisElement):
-                    r[x] = self._fields[x].to_dict()
+                v, pos = kls._decode_binary(b, pos, validate)
+                v._parent = self
+            setattr(self, slot, v)
+        if validate:
+            cls._check_fields(provided_fields)
+        return self, pos
+
+    def validate(self):
+        # Checks the whole tree against the _spec in one pass and returns
+        # every problem found as a (path, message) pair, paths being relative
+        # to self, eg "qremis.object[3].storage[0].contentLocation". Meant for
+        # trees built without checks - from_dict(validate="defer"),
+        # construct() - where fixing everything at once beats fixing one
+        # exception at a time. What's checked is emptiness, mandatory fields,
+        # types and repeatability, and the fields from_dict(validate="defer")
+        # set aside (unknown fields among them) are described as
+        # validate_dict() would. Valid trees are recognized by the generated
+        # checkers, and remembered as the serializations are, until the
+        # element or anything below it changes. Otherwise the tree is walked,
+        # iteratively - an element's errors come before those of its
+        # children, and siblings are in document order. Paths are only
+        # formatted for errors - see _format_path.
+        if self._text_cache is not None and 'valid' in self._text_cache:
+            return []
+        try:
+            valid = self._element_checker()(self)
+        except RecursionError:
+            # The checkers recurse, the walk doesn't - extensions can nest
+            # deeper than the recursion limit
+            valid = False
+        if valid:
+            if self._text_cache is None:
+                self._text_cache = {}
+            self._text_cache['valid'] = True
+            return []
+        errors = []
+        stack = [(self, None)]
+        while stack:
+            node, path = stack.pop()
+            fields = list(node._iter_fields())
+            # After _iter_fields, which builds anything pending
+            rejected = node._lazy[2] if node._lazy is not None else None
+            if not fields and not rejected:
+                errors.append((_format_path(path), "No empty elements!"))
+            children = []
+            dict_children = []
+            present = set()
+            if rejected:
+                for x, v in rejected.items():
+                    if _dict_field_errors(errors, dict_children, node.__class__, path, x, v):
+                        present.add(x)
+            if node._freeform:
+                for x, v in fields:
+                    if not isinstance(v, (list, set, tuple)):
+                        v = (v,)
+                    for i, y in enumerate(v):
+                        if isinstance(y, QremisElement):
+                            children.append((y, (path, x, i)))
+                        elif not isinstance(y, (str, dict)):
+                            errors.append((
+                                _format_path((path, x, i)),
+                                "Expected str, dict or element, got {}".format(type(y).__name__)
+                            ))
+                stack.extend(reversed(children))
+                continue
+            field_types = node._field_types
+            child_types = node._child_types
+            repeatable_fields = node._repeatable_fields
+            for x, v in fields:
+                present.add(x)
+                _type = field_types[x]
+                if x in repeatable_fields:
+                    if not isinstance(v, list):
+                        errors.append(
+                            (_format_path((path, x, None)), "Repeatable field isn't a list")
+                        )
+                        continue
+                    if not v:
+                        # Same as an absent field, as in __init__
+                        present.discard(x)
+                        continue
+                    for i, y in enumerate(v):
+                        if not isinstance(y, _type):
+                            errors.append((_format_path((path, x, i)), "Expected {}, got {}".format(
+                                _type.__name__, type(y).__name__
+                            )))
+                        elif x in child_types:
+                            children.append((y, (path, x, i)))
+                elif isinstance(v, (list, set, tuple)):
+                    errors.append((_format_path((path, x, None)), "Non-repeatable field repeated!"))
+                elif not isinstance(v, _type):
+                    errors.append((_format_path((path, x, None)), "Expected {}, got {}".format(
+                        _type.__name__, type(v).__name__
+                    )))
+                elif x in child_types:
+                    children.append((v, (path, x, None)))
+            _mandatory_errors(errors, node.__class__, present, path)
+            if dict_children:
+                _walk_dict_errors(errors, list(reversed(dict_children)))
+            stack.extend(reversed(children))
+        return errors
+
+    def fingerprint(self):
+        # Hex SHA-256 digest of the element's canonical form (see
+        # to_canonical_json), so equal content gives equal fingerprints
+        # regardless of the order of repeatable values. Digests are computed
+        # bottom up and cached per element, so after a change only the
+        # changed element and those above it are rehashed.
+        return sha256(
+            (self._xml_tag + "\x00" + _digest_tree(self, {})).encode("utf-8")
+        ).hexdigest()
+
+    def to_canonical_json(self):
+        # A canonical serialization: fields in _spec order (by name for
+        # extensions), repeatable values sorted - strings by value, elements
+        # by digest - and extension values always in lists. Always the
+        # standard library json module, so the bytes don't depend on the
+        # backend. Cached as to_json.
+        if self._text_cache is None:
+            self._text_cache = {}
+        elif 'canonical' in self._text_cache:
+            return self._text_cache['canonical']
+        memo = {}
+        _digest_tree(self, memo)
+        r = OrderedDict()
+        stack = [(self, r)]
+        while stack:
+            node, out = stack.pop()
+            if isinstance(node, dict) or node._freeform:
+                repeatable_fields = None
+            else:
+                repeatable_fields = node._repeatable_fields
+            for x, v in _canonical_fields(node):
+                values, nodes = _canonical_values(v, memo)
+                for _, y in nodes:
+                    values.append(OrderedDict())
+                    stack.append((y, values[-1]))
+                if repeatable_fields is None or x in repeatable_fields:
+                    out[x] = values
                 else:
-                    r[x] = self._fields[x]
+                    out[x] = values[0]
+        b = self._text_cache['canonical'] = json.dumps(
+            r, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        return b
+
+    def to_dict(self):
+        # Cached as to_json, and copied on the way out, so it's the caller's
+        # to modify
+        return _copy_dict(self._dict())
+
+    def _dict(self):
+        # The cached to_dict, not to be modified. Iterative rather than
+        # recursive, so depth is limited by memory rather than the recursion
+        # limit. The compiled tables say which fields hold elements and
+        # lists, only elements outside of the spec need checking.
+        if self._text_cache is None:
+            self._text_cache = {}
+        elif 'dict' in self._text_cache:
+            return self._text_cache['dict']
+        r = self._text_cache['dict'] = {}
+        stack = [(self, r)]
+        while stack:
+            node, out = stack.pop()
+            if node._freeform:
+                for x, v in node._iter_fields():
+                    if isinstance(v, (list, set, tuple)):
+                        out[x] = values = []
+                        for y in v:
+                            if isinstance(y, QremisElement):
+                                values.append({})
+                                stack.append((y, values[-1]))
+                            else:
+                                values.append(y)
+                    elif isinstance(v, QremisElement):
+                        out[x] = {}
+                        stack.append((v, out[x]))
+                    else:
+                        out[x] = v
+                continue
+            child_types = node._child_types
+            repeatable_fields = node._repeatable_fields
+            for x, v in node._iter_fields():
+                if x in child_types:
+                    if x in repeatable_fields:
+                        out[x] = values = []
+                        for y in v:
+                            values.append({})
+                            stack.append((y, values[-1]))
+                    else:
+                        out[x] = {}
+                        stack.append((v, out[x]))
+                elif x in repeatable_fields:
+                    out[x] = list(v)
+                else:
+                    out[x] = v
         return r
 
     def to_xml_element(self):
-        # TODO:
-        # This doesn't play nicely with iter_wrap unless I change it to two callbacks,
-        # maybe a kwarg like...
-        # iter_callback = None and if iter_callback is None iter_callback=callback
-        import xml.etree.ElementTree as ET
-        e = ET.Element(lowerFirst(self.__class__.__name__))
-        for x in self._fields:
-            if isinstance(self._fields[x], list) or \
-                    isinstance(self._fields[x], set) or \
-                    isinstance(self._fields[x], tuple):
-                for y in self._fields[x]:
+        # Iterative, as to_dict. The stack holds (element or nested extension
+        # dict, ET.Element to fill in) pairs - the ET.Elements are attached
+        # to their parents as soon as they're created, so order is preserved.
+        root = ET.Element(self._xml_tag)
+        stack = [(self, root)]
+        while stack:
+            node, e = stack.pop()
+            if isinstance(node, dict):
+                fields = node.items()
+            elif not node._freeform:
+                child_types = node._child_types
+                repeatable_fields = node._repeatable_fields
+                for x, v in node._iter_fields():
+                    if x in child_types:
+                        if x in repeatable_fields:
+                            for y in v:
+                                stack.append((y, ET.SubElement(e, y._xml_tag)))
+                        else:
+                            stack.append((v, ET.SubElement(e, v._xml_tag)))
+                    elif x in repeatable_fields:
+                        for y in v:
+                            ET.SubElement(e, x).text = y
+                    else:
+                        ET.SubElement(e, x).text = v
+                continue
+            else:
+                fields = node._iter_fields()
+            for x, v in fields:
+                if not isinstance(v, (list, set, tuple)):
+                    v = (v,)
+                for y in v:
+                    if isinstance(y, QremisElement):
+                        stack.append((y, ET.SubElement(e, y._xml_tag)))
+                    elif isinstance(y, dict):
+                        stack.append((y, ET.SubElement(e, x)))
+                    else:
+                        ET.SubElement(e, x).text = y
+        return root
+
+    def iter_xml_chunks(self):
+        # Yields the XML serialization of the element as str chunks, without
+        # building an ElementTree. "".join()'d and encoded this is identical
+        # to ET.tostring(self.to_xml_element()).
+        # The stack holds, in reverse order, the chunks still to come: str
+        # chunks ready to go, elements, and (tag, dict) for nested extension
+        # subtrees. Elements with a cached serialization (see to_xml_string)
+        # are emitted from that.
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                yield item
+                continue
+            if isinstance(item, tuple):
+                tag, fields = item[0], item[1].items()
+            else:
+                if item._text_cache is not None and 'xml' in item._text_cache:
+                    yield item._text_cache['xml']
+                    continue
+                tag, fields = item._xml_tag, item._iter_fields()
+            pending = []
+            for x, v in fields:
+                if not isinstance(v, (list, set, tuple)):
+                    v = (v,)
+                for y in v:
                     if isinstance(y, QremisElement):
-                        e.append(y.to_xml_element())
+                        pending.append(y)
+                    elif isinstance(y, dict):
+                        pending.append((x, y))
+                    elif y:
+                        pending.append("<{}>{}</{}>".format(x, _escape_xml_text(y), x))
                     else:
-                        i = ET.Element(x)
-                        i.text = y
-                        e.append(i)
+                        pending.append("<{} />".format(x))
+            if not pending:
+                yield "<{} />".format(tag)
+                continue
+            yield "<{}>".format(tag)
+            stack.append("</{}>".format(tag))
+            pending.reverse()
+            stack.extend(pending)
+
+    def to_xml_string(self):
+        # The XML serialization as a str, cached until the element (or
+        # anything below it) changes
+        if self._text_cache is None:
+            self._text_cache = {}
+        elif 'xml' in self._text_cache:
+            return self._text_cache['xml']
+        text = self._text_cache['xml'] = "".join(self.iter_xml_chunks())
+        return text
+
+    def write_xml(self, f, encoding="us-ascii", buffer_size=65536):
+        # Writes the element to the file object f (a text file if encoding is
+        # "unicode", otherwise binary), with the same output
+        # ET.ElementTree(self.to_xml_element()).write(f, encoding) would give.
+        _write_chunks(self.iter_xml_chunks(), f, encoding, buffer_size)
+
+
+def _escape_xml_text(text):
+    # The same escaping ElementTree applies to element text
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _copy_dict(d):
+    # A copy of a to_dict tree, down to the strings. Iterative, as to_dict.
+    r = {}
+    stack = [(d, r)]
+    while stack:
+        src, out = stack.pop()
+        for x, v in src.items():
+            if v.__class__ is dict:
+                out[x] = y = {}
+                stack.append((v, y))
+            elif v.__class__ is list:
+                out[x] = values = v[:]
+                for i, y in enumerate(values):
+                    if y.__class__ is dict:
+                        values[i] = z = {}
+                        stack.append((y, z))
             else:
-                if isinstance(self._fields[x], QremisElement):
-                    e.append(self._fields[x].to_xml_element())
+                out[x] = v
+    return r
+
+
+def _format_path(path):
+    # Paths are built as (parent path, fieldname, index or None) triples, with
+    # None for the root, and only turned into strings when they're needed
+    parts = []
+    while path is not None:
+        path, x, i = path
+        if i is not None:
+            parts.append("{}[{}]".format(x, i))
+        else:
+            parts.append(x)
+    return ".".join(reversed(parts))
+
+
+# Leads every binary serialization, the last byte is the format version
+_BINARY_MAGIC = b"QRB\x01"
+
+
+def _write_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(b, pos):
+    try:
+        n = b[pos]
+        pos += 1
+        if n < 0x80:
+            return n, pos
+        n &= 0x7f
+        shift = 7
+        while True:
+            byte = b[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return n, pos
+            shift += 7
+    except IndexError:
+        raise _truncated(pos)
+
+
+def _write_str(out, s):
+    s = s.encode("utf-8")
+    _write_varint(out, len(s))
+    out += s
+
+
+def _read_str(b, pos):
+    n, pos = _read_varint(b, pos)
+    end = pos + n
+    if end > len(b):
+        raise _truncated(len(b))
+    return b[pos:end].decode("utf-8"), end
+
+
+def _truncated(pos):
+    return ValueError("Truncated binary serialization, ended at byte {}".format(pos))
+
+
+# Type markers for values within extensions in the binary format
+_BINARY_STR = 0
+_BINARY_DICT = 1
+_BINARY_ELEMENT = 2
+
+
+def _write_freeform_value(out, value):
+    if isinstance(value, QremisElement):
+        out.append(_BINARY_ELEMENT)
+        _write_str(out, value._xml_tag)
+        value._encode_binary(out)
+    elif isinstance(value, dict):
+        out.append(_BINARY_DICT)
+        _write_varint(out, len(value))
+        for x, v in value.items():
+            _write_str(out, x)
+            if not isinstance(v, (list, set, tuple)):
+                v = (v,)
+            _write_varint(out, len(v))
+            for y in v:
+                _write_freeform_value(out, y)
+    else:
+        out.append(_BINARY_STR)
+        _write_str(out, value)
+
+
+def _read_freeform_value(b, pos, validate):
+    if pos >= len(b):
+        raise _truncated(pos)
+    marker = b[pos]
+    pos += 1
+    if marker == _BINARY_STR:
+        return _read_str(b, pos)
+    if marker == _BINARY_DICT:
+        value = {}
+        n, pos = _read_varint(b, pos)
+        for _ in range(n):
+            x, pos = _read_str(b, pos)
+            if validate and x in value:
+                raise ValueError("Field repeated! - {}".format(x))
+            count, pos = _read_varint(b, pos)
+            value[x] = []
+            for _ in range(count):
+                y, pos = _read_freeform_value(b, pos, validate)
+                value[x].append(y)
+        return value, pos
+    if marker == _BINARY_ELEMENT:
+        tag, pos = _read_str(b, pos)
+        return _element_classes[tag]._decode_binary(b, pos, validate)
+    raise ValueError("Unknown value marker {}".format(marker))
+
+
+def _canonical_fields(node):
+    # [(fieldname, values)] for an element or nested extension dict in
+    # canonical order - _spec order, or by name where there's no spec - with
+    # single values wrapped in a tuple
+    if isinstance(node, dict):
+        fields = sorted(node.items(), key=itemgetter(0))
+    elif node._freeform:
+        fields = sorted(node._iter_fields(), key=itemgetter(0))
+    else:
+        fields = node._iter_fields()
+    return [
+        (x, v if isinstance(v, (list, set, tuple)) else (v,))
+        for x, v in fields
+    ]
+
+
+def _cached_digest(node, memo):
+    if isinstance(node, dict):
+        return memo.get(id(node))
+    if node._text_cache is None:
+        return None
+    return node._text_cache.get('digest')
+
+
+def _canonical_values(values, memo):
+    # A field's values in canonical order: strings sorted, then everything
+    # else sorted by digest (which must already be computed)
+    strs = []
+    nodes = []
+    for y in values:
+        if isinstance(y, (QremisElement, dict)):
+            nodes.append((_cached_digest(y, memo), y))
+        else:
+            strs.append(y)
+    strs.sort()
+    nodes.sort(key=itemgetter(0))
+    return strs, nodes
+
+
+# Encodes what _digest_tree hashes
+_canonical_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _digest_tree(root, memo):
+    # Hex SHA-256 of the canonical form of an element or nested extension
+    # dict, with children contributing their own digests. Iterative and bottom
+    # up; elements keep their digests in _text_cache, so they're dropped along
+    # with every other cached serialization, dicts keep theirs in memo.
+    #
+    # What's hashed is the JSON of [[fieldname, [strings], [child digests]]],
+    # which the standard library encodes quickly and unambiguously. The
+    # compiled tables say which fields of specified elements hold elements.
+    d = _cached_digest(root, memo)
+    if d is not None:
+        return d
+    stack = [(root, None)]
+    while stack:
+        node, fields = stack.pop()
+        if fields is None:
+            if _cached_digest(node, memo) is not None:
+                continue
+            if isinstance(node, dict) or node._freeform:
+                fields = _canonical_fields(node)
+                stack.append((node, fields))
+                for x, v in fields:
+                    for y in v:
+                        if isinstance(y, (QremisElement, dict)):
+                            stack.append((y, None))
+                continue
+            fields = list(node._iter_fields())
+            stack.append((node, fields))
+            child_types = node._child_types
+            repeatable_fields = node._repeatable_fields
+            for x, v in fields:
+                if x in child_types:
+                    if x in repeatable_fields:
+                        for y in v:
+                            stack.append((y, None))
+                    else:
+                        stack.append((v, None))
+            continue
+        parts = []
+        if isinstance(node, dict) or node._freeform:
+            for x, v in fields:
+                strs, nodes = _canonical_values(v, memo)
+                parts.append((x, strs, [y[0] for y in nodes]))
+        else:
+            child_types = node._child_types
+            repeatable_fields = node._repeatable_fields
+            for x, v in fields:
+                if x in child_types:
+                    if x in repeatable_fields:
+                        parts.append((x, (), sorted(y._text_cache['digest'] for y in v)))
+                    else:
+                        parts.append((x, (), (v._text_cache['digest'],)))
+                elif x in repeatable_fields:
+                    parts.append((x, sorted(v), ()))
                 else:
-                    i = ET.Element(x)
-                    i.text = self._fields[x]
-                    e.append(i)
-        return e
+                    parts.append((x, (v,), ()))
+        d = sha256(_canonical_encode(parts).encode("utf-8")).hexdigest()
+        if isinstance(node, dict):
+            memo[id(node)] = d
+        else:
+            if node._text_cache is None:
+                node._text_cache = {}
+            node._text_cache['digest'] = d
+    return _cached_digest(root, memo)
 
 
-class ExtensionElement(QremisElement):
-    # Extension Elements are (almost) wholely uncontrolled. At the moment I'm preventing them
-    # from being init'd empty. They (by default) assume fields are repeatable unless the kwarg
-    # in set_field is set to False
+def _xml_element_to_value(e):
+    # Nested subtrees within extensions are read as dicts of lists
+    if len(e) == 0:
+        return e.text or ""
+    r = {}
+    for child in e:
+        if child.tag in r:
+            r[child.tag].append(_xml_element_to_value(child))
+        else:
+            r[child.tag] = [_xml_element_to_value(child)]
+    return r
+
+
+def _write_chunks(chunks, f, encoding, buffer_size):
+    # Writes an iterable of str chunks to f in batches of about buffer_size
+    # characters, encoded the way ElementTree would encode them
+    if encoding.lower() == "unicode":
+        encode = None
+    else:
+        encode = partial(str.encode, encoding=encoding, errors="xmlcharrefreplace")
+        if encoding.lower() not in ("utf-8", "us-ascii"):
+            f.write(encode("<?xml version='1.0' encoding='{}'?>\n".format(encoding)))
+    buffered = []
+    size = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        size += len(chunk)
+        if size >= buffer_size:
+            f.write("".join(buffered) if encode is None else encode("".join(buffered)))
+            buffered = []
+            size = 0
+    if buffered:
+        f.write("".join(buffered) if encode is None else encode("".join(buffered)))
+
+
+class _FreeformElement(QremisElement):
+    # Storage for elements outside of the specification, which can hold
+    # arbitrary fields and so keep them in a plain dict rather than slots
+    __slots__ = ('_fields',)
+    _freeform = True
+
+    def _iter_fields(self):
+        return iter(self._fields.items())
+
+    def _set_raw(self, fieldname, fieldvalue):
+        self._fields[fieldname] = fieldvalue
+        if self._lazy is not None:
+            self._discard_pending(fieldname)
+
+    def _del_raw(self, fieldname):
+        lazy = self._lazy
+        if lazy is not None and lazy[2] is not None and fieldname in lazy[2]:
+            self._discard_pending(fieldname)
+            return
+        del self._fields[fieldname]
+
+    def get_field(self, fieldname):
+        return self._fields[fieldname]
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        for x, v in self._fields.items():
+            if v.__class__ is list:
+                self._fields[x] = _field_list(self, v)
+
     @classmethod
-    def from_dict(cls, d):
-        if len(d) == 0:
+    def _blank(cls):
+        self = cls.__new__(cls)
+        _init_bookkeeping(self)
+        self._fields = {}
+        return self
+
+    @classmethod
+    def from_xml_element(cls, e, validate=True):
+        # Everything is repeatable, and nested subtrees come through as
+        # dicts, the same as they would from JSON
+        if validate and len(e) == 0:
             raise ValueError("No empty elements!")
-        kwargs = {}
-        for x in d:
-            # Make up a spec on the fly
-            # everything is repeatable and elements must be the type they are.
-            spec = {'repeatable': True, 'type': type(x)}
-            if spec['repeatable'] is False:
-                if spec['type'] == str:
-                    kwargs[x] = d[x]
-                elif QremisElement in getmro(spec['type']):
-                    kwargs[x] = spec['type'].from_dict(d[x])
-                else:
-                    raise TypeError()
+        self = cls._blank()
+        for child in e:
+            if child.tag in self._fields:
+                list.append(self._fields[child.tag], _xml_element_to_value(child))
             else:
-                kwargs[x] = []
-                for y in d[x]:
-                    if spec['type'] == str:
-                        kwargs[x].append(y)
-                    elif QremisElement in getmro(spec['type']):
-                        kwargs[x].append(spec['type'].from_dict(y))
-                    else:
-                        raise TypeError()
-        return cls(**kwargs)
+                self._fields[child.tag] = _field_list(self, (_xml_element_to_value(child),))
+        return self
 
+    @classmethod
+    def from_dict(cls, d, validate=True, lazy=False):
+        # Nothing to be lazy about in here, it's all strings.
+        # Everything is repeatable and values are kept as they are.
+        if validate == "defer":
+            return cls._from_dict_deferred(d)
+        if validate and len(d) == 0:
+            raise ValueError("No empty elements!")
+        self = cls._blank()
+        self._fields = dict((x, _field_list(self, v)) for x, v in d.items())
+        return self
+
+    @classmethod
+    def _decoder(cls, validate):
+        return partial(cls.from_dict, validate=validate)
+
+    @classmethod
+    def _dict_checker(cls):
+        return _check_freeform_dict
+
+    @classmethod
+    def _element_checker(cls):
+        return _check_freeform_element
+
+    def _encode_binary(self, out):
+        # Field names can't be coded here, so they're written out, and values
+        # are marked with their type
+        _write_varint(out, len(self._fields))
+        for x, v in self._fields.items():
+            _write_str(out, x)
+            if not isinstance(v, (list, set, tuple)):
+                v = (v,)
+            _write_varint(out, len(v))
+            for y in v:
+                _write_freeform_value(out, y)
+
+    @classmethod
+    def _decode_binary(cls, b, pos, validate):
+        self = cls._blank()
+        n, pos = _read_varint(b, pos)
+        if validate and n == 0:
+            raise ValueError("No empty elements!")
+        for _ in range(n):
+            x, pos = _read_str(b, pos)
+            if validate and x in self._fields:
+                raise ValueError("Field repeated! - {}".format(x))
+            count, pos = _read_varint(b, pos)
+            v = self._fields[x] = _field_list(self, ())
+            for _ in range(count):
+                y, pos = _read_freeform_value(b, pos, validate)
+                if isinstance(y, QremisElement):
+                    _adopt(self, y)
+                list.append(v, y)
+        return self, pos
+
+    @classmethod
+    def construct(cls, **kwargs):
+        # Everything is repeatable out here
+        self = cls._blank()
+        for x, v in kwargs.items():
+            if isinstance(v, (list, set, tuple)):
+                self._fields[x] = _field_list(self, v)
+            else:
+                self._fields[x] = _field_list(self, (v,))
+        return self
+
+
+class ExtensionElement(_FreeformElement):
+    # Extension Elements are (almost) wholely uncontrolled. At the moment I'm preventing them
+    # from being init'd empty. They (by default) assume fields are repeatable unless the kwarg
+    # in set_field is set to False
     def __init__(self, **kwargs):
         if len(kwargs) == 0:
             raise ValueError("No empty elements!")
+        _init_bookkeeping(self)
         self._fields = {}
         for x in kwargs:
             self.add_to_field(x, kwargs[x])
@@ -253,34 +1952,7 @@ class ExtensionElement(QremisElement):
         super().set_field(fieldname, fieldvalue, _type=_type, repeatable=repeatable)
 
 
-class ExtendedElement(QremisElement):
-    @classmethod
-    def from_dict(cls, d):
-        if len(d) == 0:
-            raise ValueError("No empty elements!")
-        kwargs = {}
-        for x in d:
-            # Make up a spec on the fly
-            # everything is repeatable and elements must be the type they are.
-            spec = {'repeatable': True, 'type': type(x)}
-            if spec['repeatable'] is False:
-                if spec['type'] == str:
-                    kwargs[x] = d[x]
-                elif QremisElement in getmro(spec['type']):
-                    kwargs[x] = spec['type'].from_dict(d[x])
-                else:
-                    raise TypeError()
-            else:
-                kwargs[x] = []
-                for y in d[x]:
-                    if spec['type'] == str:
-                        kwargs[x].append(y)
-                    elif QremisElement in getmro(spec['type']):
-                        kwargs[x].append(spec['type'].from_dict(y))
-                    else:
-                        raise TypeError()
-        return cls(**kwargs)
-
+class ExtendedElement(_FreeformElement):
     def __init__(self, **kwargs):
         # Values can only be set in the init via kwargs
         # We don't dynamically whip up any any getters or setters, and there's no validation
@@ -292,6 +1964,7 @@ class ExtendedElement(QremisElement):
         # set_field(), add_to_field(), get_field(), and del_field()
         if len(kwargs) == 0:
             raise ValueError("No empty elements!")
+        _init_bookkeeping(self)
         self._fields = {}
         for x in kwargs:
             iter_wrap(kwargs[x], partial(self.add_to_field, x))
@@ -1524,6 +3197,21 @@ class Relationship(QremisElement):
 
 
 class Qremis(QremisElement):
+    # _identifier_index is None (or unset), or a dict of
+    # (identifierType, identifierValue) -> entity, see get_entity_by_identifier
+    __slots__ = ('_identifier_index',)
+    _bookkeeping_slots = QremisElement._bookkeeping_slots + ('_identifier_index',)
+    _indexed = True
+    # entity field -> (identifier field, type field, value field)
+    _identifier_fields = MappingProxyType({
+        'object': ('objectIdentifier', 'objectIdentifierType', 'objectIdentifierValue'),
+        'event': ('eventIdentifier', 'eventIdentifierType', 'eventIdentifierValue'),
+        'agent': ('agentIdentifier', 'agentIdentifierType', 'agentIdentifierValue'),
+        'rights': ('rightsIdentifier', 'rightsIdentifierType', 'rightsIdentifierValue'),
+        'relationship': (
+            'relationshipIdentifier', 'relationshipIdentifierType', 'relationshipIdentifierValue'
+        )
+    })
     _spec = {
         'object': {
             'repeatable': True,
@@ -1552,6 +3240,49 @@ class Qremis(QremisElement):
         }
     }
 
+    def get_entity_by_identifier(self, identifierType, identifierValue, kind=None):
+        # The object, event, agent, rights or relationship with the given
+        # identifier (the first one, if several of a kind share it), or
+        # KeyError. Entities of different kinds may share an identifier, so
+        # kind ("object", "event", etc) says which is wanted - without it,
+        # an identifier held by more than one kind is a ValueError.
+        # Looked up in an index built on first use, which add_object() etc
+        # add to. Any other change in the record drops it, to be rebuilt by
+        # the next lookup.
+        index = getattr(self, '_identifier_index', None)
+        if index is None:
+            index = {}
+            for x in self._identifier_fields:
+                try:
+                    entities = self.get_field(x)
+                except KeyError:
+                    continue
+                for entity in entities:
+                    self._index_entity(index, x, entity)
+            self._identifier_index = index
+        kinds = index[identifierType, identifierValue]
+        if kind is not None:
+            return kinds[kind]
+        if len(kinds) > 1:
+            raise ValueError("{} {} identifies entities of several kinds ({}), pass kind".format(
+                identifierType, identifierValue, ", ".join(kinds)
+            ))
+        for entity in kinds.values():
+            return entity
+
+    def _index_entity(self, index, fieldname, entity):
+        # index is (identifierType, identifierValue) -> {kind: entity}
+        for _, identifierType, identifierValue in _identifier_keys(fieldname, entity):
+            index.setdefault((identifierType, identifierValue), {}).setdefault(fieldname, entity)
+
+    def add_to_field(self, fieldname, fieldvalue, _type=None):
+        # Keeps a built index up to date rather than dropping it
+        index = getattr(self, '_identifier_index', None)
+        super().add_to_field(fieldname, fieldvalue, _type=_type)
+        if index is not None:
+            self._index_entity(index, fieldname, fieldvalue)
+            self._identifier_index = index
+
 
 class QremisRoot(QremisElement):
     # Root node for making recursion sane
@@ -1567,6 +3298,53 @@ class QremisRoot(QremisElement):
     }
 
 
+# Entity class -> the Qremis field (and so the kind of entity) it belongs in
+_entity_kinds = dict((v, k) for k, v in Qremis._child_types.items())
+
+
+def _iter_entities(record, kinds=None):
+    # (kind, entity) for every entity in a QremisRoot or Qremis (of one of
+    # kinds, if given), or for record itself if it is a single entity
+    if isinstance(record, QremisRoot):
+        record = record.get_qremis()
+    if not isinstance(record, Qremis):
+        if record.__class__ not in _entity_kinds:
+            raise TypeError("Not an entity - {}".format(record.__class__.__name__))
+        yield _entity_kinds[record.__class__], record
+        return
+    for kind in Qremis._identifier_fields:
+        if kinds is not None and kind not in kinds:
+            continue
+        try:
+            entities = record.get_field(kind)
+        except KeyError:
+            continue
+        for entity in entities:
+            yield kind, entity
+
+
+def _identifier_keys(kind, element, fields=None):
+    # [(kind, identifierType, identifierValue)] for every complete identifier
+    # of element, an entity of kind. fields is the (identifier field, type
+    # field, value field) to read them from, by default the entity's own
+    # identifiers - or eg, the linkingObjectIdentifier fields of a
+    # relationship, naming the objects it links. Elements without any give [].
+    identifier_field, type_field, value_field = fields or Qremis._identifier_fields[kind]
+    try:
+        identifiers = element.get_field(identifier_field)
+    except KeyError:
+        return []
+    if not isinstance(identifiers, list):
+        identifiers = [identifiers]
+    keys = []
+    for x in identifiers:
+        try:
+            keys.append((kind, x.get_field(type_field), x.get_field(value_field)))
+        except KeyError:
+            continue
+    return keys
+
+
 def enumerate_specification(kls=QremisRoot):
     r = {}
     for x in kls._spec:
@@ -1579,3 +3357,96 @@ def enumerate_specification(kls=QremisRoot):
                 ExtendedElement not in getmro(kls._spec[x]['type']):
             r[x]['spec'] = enumerate_specification(kls=kls._spec[x]['type'])
     return r
+
+
+def validate_dict(d, cls=QremisRoot):
+    # Checks a dict tree, as from_dict takes it, against the compiled _spec
+    # tables of cls and its children without building any elements - for
+    # accepting or rejecting input which isn't otherwise needed. Returns every
+    # problem found as a (path, message) pair, the same as
+    # QremisElement.validate(), so an empty list means the input is valid.
+    # Input is first run through the generated checkers, and only walked
+    # (iteratively, in the same order as validate()) to describe the errors
+    # when that fails.
+    if cls._dict_checker()(d):
+        return []
+    errors = []
+    _walk_dict_errors(errors, [(cls, d, None)])
+    return errors
+
+
+def _walk_dict_errors(errors, stack):
+    # The walk of validate_dict(), from the (class, dict, path) on stack,
+    # adding what's found to errors. Also describes the raw values
+    # from_dict(validate="defer") sets aside, for validate().
+    while stack:
+        kls, node, path = stack.pop()
+        if not isinstance(node, dict):
+            errors.append((_format_path(path), "Expected dict, got {}".format(type(node).__name__)))
+            continue
+        if not node:
+            errors.append((_format_path(path), "No empty elements!"))
+        children = []
+        present = set()
+        for x, v in node.items():
+            if _dict_field_errors(errors, children, kls, path, x, v):
+                present.add(x)
+        _mandatory_errors(errors, kls, present, path)
+        stack.extend(reversed(children))
+
+
+def _dict_field_errors(errors, children, kls, path, x, v):
+    # Adds the errors in the value v of field x of a dict for kls to errors,
+    # and the child element dicts it holds to children as (class, dict,
+    # path). Returns whether the field counts as present.
+    if kls._freeform:
+        # Everything is repeatable, anything can be nested
+        if not isinstance(v, (list, tuple)):
+            errors.append((_format_path((path, x, None)), "Repeatable field isn't a list"))
+            return True
+        for i, y in enumerate(v):
+            if not isinstance(y, (str, dict)):
+                errors.append((
+                    _format_path((path, x, i)),
+                    "Expected str or dict, got {}".format(type(y).__name__)
+                ))
+        return True
+    field_types = kls._field_types
+    if x not in field_types:
+        errors.append((_format_path((path, x, None)), "Erroneous field!"))
+        return False
+    _type = field_types[x]
+    if x in kls._repeatable_fields:
+        if not isinstance(v, (list, tuple)):
+            errors.append((_format_path((path, x, None)), "Repeatable field isn't a list"))
+        elif not v:
+            # Same as an absent field, as in from_dict
+            return False
+        elif x in kls._child_types:
+            for i, y in enumerate(v):
+                children.append((_type, y, (path, x, i)))
+        else:
+            for i, y in enumerate(v):
+                if not isinstance(y, _type):
+                    errors.append((_format_path((path, x, i)), "Expected {}, got {}".format(
+                        _type.__name__, type(y).__name__
+                    )))
+    elif isinstance(v, (list, tuple)):
+        errors.append((_format_path((path, x, None)), "Non-repeatable field repeated!"))
+    elif x in kls._child_types:
+        children.append((_type, v, (path, x, None)))
+    elif not isinstance(v, _type):
+        errors.append((_format_path((path, x, None)), "Expected {}, got {}".format(
+            _type.__name__, type(v).__name__
+        )))
+    return True
+
+
+def _mandatory_errors(errors, kls, present, path):
+    # Adds an error for every mandatory field of kls which isn't present,
+    # in _spec order
+    mandatory_fields = kls._mandatory_fields
+    if not mandatory_fields.issubset(present):
+        for x in kls._slot_names:
+            if x in mandatory_fields and x not in present:
+                errors.append((_format_path((path, x, None)), "Required, but not present"))
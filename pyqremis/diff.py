@@ -0,0 +1,229 @@
+"""
+pyqremis.diff
+
+Structural differences between two element trees, as operations on the paths
+of pyqremis.query, and applying them
+"""
+from hashlib import sha256
+
+from . import QremisElementMeta, _canonical_encode, _format_path, _type_error, _unset
+from .query import _parse
+
+
+def _digest(root):
+    # Hex SHA-256 of an element's fields in document order - unlike
+    # fingerprint(), which ignores the order of repeatable values, equal
+    # digests here mean the elements are ==. Bottom up and cached in
+    # _text_cache, so it's dropped whenever the element or anything below it
+    # changes and only changed subtrees are rehashed.
+    cache = root._text_cache
+    if cache is not None and 'ordered_digest' in cache:
+        return cache['ordered_digest']
+    stack = [(root, None)]
+    while stack:
+        node, fields = stack.pop()
+        if fields is None:
+            if node._text_cache is not None and 'ordered_digest' in node._text_cache:
+                continue
+            if node._freeform:
+                # Extensions compare as dicts, so their fields go in by name
+                parts = sorted(node._dict().items())
+                _store_digest(node, parts)
+                continue
+            fields = list(node._iter_fields())
+            stack.append((node, fields))
+            child_types = node._child_types
+            repeatable_fields = node._repeatable_fields
+            for x, v in fields:
+                if x in child_types:
+                    if x in repeatable_fields:
+                        for y in v:
+                            stack.append((y, None))
+                    else:
+                        stack.append((v, None))
+            continue
+        child_types = node._child_types
+        repeatable_fields = node._repeatable_fields
+        parts = []
+        for x, v in fields:
+            if x not in child_types:
+                parts.append((x, v))
+            elif x in repeatable_fields:
+                parts.append((x, [y._text_cache['ordered_digest'] for y in v]))
+            else:
+                parts.append((x, v._text_cache['ordered_digest']))
+        _store_digest(node, parts)
+    return root._text_cache['ordered_digest']
+
+
+def _store_digest(node, parts):
+    if node._text_cache is None:
+        node._text_cache = {}
+    node._text_cache['ordered_digest'] = sha256(
+        _canonical_encode(parts).encode("utf-8")
+    ).hexdigest()
+
+
+def _serialize(value):
+    # Operation values: strings as they are, elements as dicts
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return [_serialize(x) for x in value]
+    return value.to_dict()
+
+
+def _diff_values(ops, children, path, x, v, w):
+    # The operations turning the values v of repeatable field x into w. The
+    # unchanged values at either end are skipped, those left in between are
+    # paired off by position - elements of the spec go on to be diffed, other
+    # values are replaced - and what's left over is added or deleted. Deletes
+    # run from the end, so every index is right when its operation is applied.
+    if isinstance(v[0], str):
+        a_keys = v
+        b_keys = w
+        recurse = False
+    else:
+        a_keys = [_digest(y) for y in v]
+        b_keys = [_digest(y) for y in w]
+        recurse = not v[0]._freeform
+    n = len(v)
+    m = len(w)
+    start = 0
+    while start < n and start < m and a_keys[start] == b_keys[start]:
+        start += 1
+    end = 0
+    while end < n - start and end < m - start and a_keys[n - 1 - end] == b_keys[m - 1 - end]:
+        end += 1
+    paired = min(n, m) - start - end
+    for i in range(start, start + paired):
+        if a_keys[i] == b_keys[i]:
+            continue
+        if recurse:
+            children.append((v[i], w[i], (path, x, i)))
+        else:
+            ops.append(("set", _format_path((path, x, i)), _serialize(w[i])))
+    for i in range(start + paired, m - end):
+        ops.append(("add", _format_path((path, x, i)), _serialize(w[i])))
+    for i in reversed(range(start + paired, n - end)):
+        ops.append(("delete", _format_path((path, x, i))))
+
+
+def diff(a, b):
+    # The operations which turn a into b, two elements of the same class, as
+    # a list of tuples which survive a round trip through JSON:
+    #
+    #   ("set", path, value)     replaces a field, or one value of a
+    #                            repeatable field when path ends with [n]
+    #   ("add", path, value)     inserts a value into a repeatable field at
+    #                            the index path ends with
+    #   ("delete", path)         removes a field, or one value of it
+    #
+    # Paths are relative to a, in the syntax of pyqremis.query
+    # ("object[3].storage[0].storageMedium"), and values are strings or the
+    # dicts from_dict takes. Operations apply in order, see patch().
+    #
+    # Subtrees are compared by cached digests before they're walked into, so
+    # the cost is in proportion to what has changed (plus digesting whatever
+    # hasn't been digested since it last changed). Extensions have no spec to
+    # walk, and are replaced whole.
+    if a.__class__ is not b.__class__:
+        raise TypeError("Can't diff {} against {}".format(
+            a.__class__.__name__, b.__class__.__name__
+        ))
+    if a._freeform:
+        raise TypeError("Can't diff extensions, only the elements holding them")
+    ops = []
+    stack = [(a, b, None)]
+    while stack:
+        x_node, y_node, path = stack.pop()
+        if x_node is y_node or _digest(x_node) == _digest(y_node):
+            continue
+        a_fields = dict(x_node._iter_fields())
+        b_fields = dict(y_node._iter_fields())
+        child_types = x_node._child_types
+        repeatable_fields = x_node._repeatable_fields
+        children = []
+        for x in x_node._slot_names:
+            v = a_fields.get(x, _unset)
+            w = b_fields.get(x, _unset)
+            if w is _unset:
+                if v is not _unset:
+                    ops.append(("delete", _format_path((path, x, None))))
+            elif v is _unset or (x in repeatable_fields and not (v and w)):
+                ops.append(("set", _format_path((path, x, None)), _serialize(w)))
+            elif x in repeatable_fields:
+                _diff_values(ops, children, path, x, v, w)
+            elif x not in child_types:
+                if v != w:
+                    ops.append(("set", _format_path((path, x, None)), w))
+            elif w._freeform:
+                if _digest(v) != _digest(w):
+                    ops.append(("set", _format_path((path, x, None)), _serialize(w)))
+            else:
+                children.append((v, w, (path, x, None)))
+        stack.extend(reversed(children))
+    return ops
+
+
+def _build(x, _type, value, validate):
+    # An operation's value as the type of field x
+    if isinstance(_type, QremisElementMeta):
+        if not isinstance(value, dict):
+            raise _type_error(x, value, dict)
+        return _type.from_dict(value, validate=validate)
+    if not isinstance(value, _type):
+        raise _type_error(x, value, _type)
+    return value
+
+
+def patch(a, ops, validate=True):
+    # Applies the operations diff() returns to a, in place and in order, and
+    # returns it. Paths are checked against the spec, and values are built
+    # with from_dict (without validation, if validate=False). Changes go
+    # through set_field/add_to_field/del_field or the fields' own lists, so
+    # caches and indexes stay right.
+    cls = a.__class__
+    for op in ops:
+        name, path = op[0], op[1]
+        steps = _parse(path, cls)
+        if not steps:
+            raise ValueError("Can't patch the root, only its fields")
+        node = a
+        for x, repeatable, index, _ in steps[:-1]:
+            node = node.get_field(x)
+            if repeatable:
+                if index is None:
+                    raise ValueError("{} needs an index, in {}".format(x, path))
+                node = node[index]
+        x, repeatable, index, owner = steps[-1]
+        _type = owner._field_types[x]
+        if name == "delete":
+            node.del_field(x, index=index)
+        elif name == "set":
+            if index is None:
+                if repeatable:
+                    value = [_build(x, _type, y, validate) for y in op[2]]
+                else:
+                    value = _build(x, _type, op[2], validate)
+                node.set_field(x, value, _type=_type, repeatable=repeatable)
+                continue
+            # The field's _FieldList adopts the value and invalidates
+            node.get_field(x)[index] = _build(x, _type, op[2], validate)
+        elif name == "add":
+            if not repeatable:
+                raise ValueError("{} isn't repeatable, in {}".format(x, path))
+            value = _build(x, _type, op[2], validate)
+            try:
+                values = node.get_field(x)
+            except KeyError:
+                values = []
+            if index is None or index == len(values):
+                node.add_to_field(x, value, _type=_type)
+                continue
+            if not -len(values) <= index < len(values):
+                raise IndexError("{} out of range, in {}".format(index, path))
+            values.insert(index, value)
+        else:
+            raise ValueError("Unknown operation! - {}".format(name))
+    return a
@@ -0,0 +1,180 @@
+"""
+pyqremis.graph
+
+Relationships resolved into a graph of the entities they link
+"""
+from collections import deque
+
+from . import Qremis, _identifier_keys, _iter_entities
+
+
+def _linking_fields(kind):
+    # The fields an identifier of kind is linked to with, eg
+    # linkingObjectIdentifier, linkingObjectIdentifierType and
+    # linkingObjectIdentifierValue
+    return tuple(
+        "linking" + x[0].upper() + x[1:] for x in Qremis._identifier_fields[kind]
+    )
+
+
+# Relationship field -> (type field, value field, kind of entity it links)
+_relationship_links = dict(
+    (fields[0], (fields[1], fields[2], kind))
+    for kind, fields in ((kind, _linking_fields(kind)) for kind in Qremis._identifier_fields)
+    if kind != 'relationship'
+)
+# The fields entities link back to their relationships with
+_entity_links = _linking_fields('relationship')
+
+
+class RelationshipGraph(object):
+    # The objects, events, agents and rights of one or more qremis records,
+    # and the relationships between them, as an undirected graph: every
+    # relationship is joined to each entity it links (by its linking*Identifier
+    # fields) or which links to it (by linkingRelationshipIdentifier).
+    #
+    # Nodes are keyed by (kind, identifierType, identifierValue), as in
+    # pyqremis.merge, so entities of different kinds which happen to share an
+    # identifier stay apart. Entities with several identifiers are a single
+    # node, keyed by their first identifier, and any of the others resolve to
+    # it - including those which were linked to before the entity itself was
+    # added, so records can be added in any order.
+    #
+    # Adjacency is kept both ways as it's built, so queries cost time in
+    # proportion to what they return rather than the size of the graph.
+    # With keep_entities=False only identifiers are kept, not elements.
+
+    def __init__(self, records=(), keep_entities=True):
+        # node -> {adjacent node: None}, an insertion ordered set
+        self._edges = {}
+        # node -> element, for nodes which have been added (not only linked to)
+        self._entities = {}
+        # secondary identifier -> the node it belongs to
+        self._aliases = {}
+        self._keep_entities = keep_entities
+        for x in records:
+            self.add(x)
+
+    def add(self, record):
+        # Adds a QremisRoot, Qremis, or a single entity (as
+        # pyqremis.streaming.iter_xml_entities yields them)
+        for kind, entity in _iter_entities(record):
+            self._add_entity(kind, entity)
+
+    def _add_entity(self, kind, entity):
+        keys = _identifier_keys(kind, entity)
+        if not keys:
+            raise ValueError("Entities without identifiers can't be linked")
+        node = self._identify(keys)
+        if self._keep_entities:
+            self._entities.setdefault(node, entity)
+        if kind == 'relationship':
+            for x, (type_field, value_field, linked_kind) in _relationship_links.items():
+                for key in _identifier_keys(linked_kind, entity, (x, type_field, value_field)):
+                    self._link(node, self._identify([key]))
+        else:
+            for key in _identifier_keys('relationship', entity, _entity_links):
+                self._link(self._identify([key]), node)
+
+    def _resolve(self, key):
+        aliases = self._aliases
+        while key in aliases:
+            key = aliases[key]
+        return key
+
+    def _identify(self, keys):
+        # The node for an entity with identifiers keys, merging in the nodes
+        # of any of them seen separately before
+        node = self._resolve(keys[0])
+        self._edges.setdefault(node, {})
+        for key in keys[1:]:
+            other = self._resolve(key)
+            if other != node:
+                self._merge(other, node)
+        return node
+
+    def _merge(self, other, node):
+        self._aliases[other] = node
+        edges = self._edges
+        for x in edges.pop(other, ()):
+            del edges[x][other]
+            edges[x][node] = None
+            edges[node][x] = None
+        if other in self._entities:
+            self._entities.setdefault(node, self._entities.pop(other))
+
+    def _link(self, relationship, entity):
+        self._edges[relationship][entity] = None
+        self._edges[entity][relationship] = None
+
+    def __contains__(self, key):
+        return self._resolve(key) in self._edges
+
+    def __len__(self):
+        return len(self._edges)
+
+    def __iter__(self):
+        return iter(self._edges)
+
+    def kind(self, key):
+        # 'object', 'event', 'agent', 'rights' or 'relationship' - the first
+        # part of the key of the node key resolves to
+        node = self._resolve(key)
+        if node not in self._edges:
+            raise KeyError(key)
+        return node[0]
+
+    def entity(self, key):
+        # The element, for nodes which were added rather than only linked to
+        # (and only with keep_entities)
+        return self._entities[self._resolve(key)]
+
+    def links(self, key, kind=None):
+        # The relationships an entity takes part in, or the entities a
+        # relationship links, optionally only those of kind
+        edges = self._edges[self._resolve(key)]
+        if kind is None:
+            return list(edges)
+        return [x for x in edges if x[0] == kind]
+
+    def linked(self, key, kind=None):
+        # The entities which share a relationship with an entity (or, for a
+        # relationship, the entities it links), optionally only those of kind
+        node = self._resolve(key)
+        edges = self._edges
+        if node[0] == 'relationship':
+            return self.links(node, kind=kind)
+        r = {}
+        for x in edges[node]:
+            for y in edges[x]:
+                if y != node and (kind is None or y[0] == kind):
+                    r[y] = None
+        return list(r)
+
+    def path(self, start, end, max_depth=None):
+        # The shortest chain of nodes from start to end, alternating entities
+        # and relationships, as a list including both ends, or None if
+        # they aren't connected (within max_depth hops). Breadth first.
+        start = self._resolve(start)
+        end = self._resolve(end)
+        if start not in self._edges or end not in self._edges:
+            raise KeyError(start if start not in self._edges else end)
+        edges = self._edges
+        previous = {start: None}
+        queue = deque([(start, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            if node == end:
+                r = []
+                while node is not None:
+                    r.append(node)
+                    node = previous[node]
+                r.reverse()
+                return r
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for x in edges[node]:
+                if x not in previous:
+                    previous[x] = node
+                    queue.append((x, depth + 1))
+        return None
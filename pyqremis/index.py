@@ -0,0 +1,98 @@
+"""
+pyqremis.index
+
+Inverted indexes from the values of leaf fields to the entities holding them
+"""
+from . import Qremis, QremisElementMeta, _identifier_keys, _iter_entities
+from .query import Query
+
+
+def _compile_path(path):
+    # "object.objectCharacteristics.fixity.messageDigest" -> ("object",
+    # Query("objectCharacteristics.fixity.messageDigest", cls=Object)),
+    # which must end with a leaf field
+    kind, _, rest = path.partition(".")
+    try:
+        cls = Qremis._child_types[kind]
+    except KeyError:
+        raise ValueError("{} doesn't start with an entity - one of {}".format(
+            path, ", ".join(Qremis._child_types)
+        ))
+    query = Query(rest, cls=cls)
+    if isinstance(query.result_type, QremisElementMeta):
+        raise ValueError("{} doesn't end with a leaf field".format(path))
+    return kind, query
+
+
+class ValueIndex(object):
+    # Maps the values found at leaf field paths, such as
+    # "object.objectCharacteristics.fixity.messageDigest" or "event.eventType",
+    # to the entities they were found in, over any number of records. Paths
+    # start with the kind of entity and are checked against the _spec when
+    # the index is created; the rest of the path is a pyqremis.query.Query
+    # relative to the entity, so repeatable fields along the way are followed
+    # into every value.
+    #
+    # Entities are indexed as they're added, so the index can be built in
+    # bulk from a stream of records and added to later. With
+    # keep_entities=False each entity is represented by its first
+    # (identifierType, identifierValue) rather than the element itself.
+
+    def __init__(self, paths, records=(), keep_entities=True):
+        # kind -> [(path, query)]
+        self._paths = {}
+        # path -> {value: [entity]}
+        self._index = {}
+        for path in paths:
+            kind, query = _compile_path(path)
+            self._paths.setdefault(kind, []).append((path, query))
+            self._index[path] = {}
+        self._keep_entities = keep_entities
+        for x in records:
+            self.add(x)
+
+    def add(self, record):
+        # Adds a QremisRoot, Qremis, or a single entity (as
+        # pyqremis.streaming.iter_xml_entities yields them). Only entities
+        # of the kinds the paths start with are looked at.
+        for kind, entity in _iter_entities(record, kinds=self._paths):
+            self._add_entity(kind, entity)
+
+    def _add_entity(self, kind, entity):
+        paths = self._paths.get(kind)
+        if not paths:
+            return
+        if self._keep_entities:
+            ref = entity
+        else:
+            ref = self._identifier(kind, entity)
+        for path, query in paths:
+            index = self._index[path]
+            # An entity is listed once per value, however many times it holds it
+            for value in dict.fromkeys(query(entity)):
+                index.setdefault(value, []).append(ref)
+
+    @staticmethod
+    def _identifier(kind, entity):
+        # The first complete (identifierType, identifierValue) of entity
+        keys = _identifier_keys(kind, entity)
+        if not keys:
+            raise ValueError(
+                "Entities without identifiers can't be indexed with keep_entities=False"
+            )
+        return keys[0][1:]
+
+    def lookup(self, path, value):
+        # The entities which hold value at path, in the order they were added
+        return list(self._index[path].get(value, ()))
+
+    def values(self, path):
+        # The distinct values found at path
+        return list(self._index[path])
+
+    def shared(self, path):
+        # (value, entities) for every value at path held by more than one
+        # entity - eg, objects with the same digest
+        for value, entities in self._index[path].items():
+            if len(entities) > 1:
+                yield value, list(entities)
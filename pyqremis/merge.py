@@ -0,0 +1,201 @@
+"""
+pyqremis.merge
+
+Combining many qremis records into one, deduplicating entities by identifier
+"""
+import json
+import os
+import tempfile
+
+from . import Qremis, _identifier_keys, _iter_entities
+
+# Dropped into spill files between the kind of an entity and its JSON
+_SEPARATOR = b"\t"
+
+
+def _copy(value):
+    if isinstance(value, str):
+        return value
+    return value.from_dict(value.to_dict(), validate=False)
+
+
+def _value_key(value):
+    # What values of repeatable fields are deduplicated by
+    if isinstance(value, str):
+        return value
+    return value.fingerprint()
+
+
+class _Groups:
+    # Union-find over identifiers: every identifier belongs to a group, and
+    # an entity with several identifiers joins their groups into one
+    def __init__(self):
+        # identifier -> group
+        self._groups = {}
+        # group -> the group it was joined into, for groups which have been
+        self._joined = {}
+        self._next = 0
+
+    def find(self, group):
+        joined = self._joined
+        root = group
+        while root in joined:
+            root = joined[root]
+        while group != root:
+            following = joined[group]
+            joined[group] = root
+            group = following
+        return root
+
+    def add(self, keys):
+        # The group of keys, and the groups (if any) which were joined into
+        # it. The oldest group survives a join.
+        groups = []
+        for key in keys:
+            group = self._groups.get(key)
+            if group is not None:
+                group = self.find(group)
+                if group not in groups:
+                    groups.append(group)
+        if not groups:
+            group = self._next
+            self._next += 1
+        else:
+            groups.sort()
+            group = groups[0]
+            for x in groups[1:]:
+                self._joined[x] = group
+        for key in keys:
+            self._groups.setdefault(key, group)
+        return group, groups[1:]
+
+
+class _Merger:
+    # Merges entities in memory. The first entity of a group is copied, and
+    # later ones are merged into the copy: the values of repeatable fields
+    # which it doesn't already have (by value, or by fingerprint for
+    # elements) are added, non-repeatable fields it doesn't have are set.
+    def __init__(self):
+        self._groups = _Groups()
+        # group -> (kind, merged entity, {fieldname: set of value keys})
+        self._merged = {}
+        # kind -> [group], in the order the groups were first seen
+        self._order = dict((x, []) for x in Qremis._identifier_fields)
+        # Entities without identifiers, which can't be merged with anything
+        self._unidentified = dict((x, []) for x in Qremis._identifier_fields)
+
+    def add(self, kind, entity, copy=True):
+        keys = _identifier_keys(kind, entity)
+        if not keys:
+            self._unidentified[kind].append(_copy(entity) if copy else entity)
+            return
+        group, joined = self._groups.add(keys)
+        if group not in self._merged:
+            self._merged[group] = (kind, _copy(entity) if copy else entity, None)
+            self._order[kind].append(group)
+            return
+        # Older entities first, so their values win
+        for x in joined:
+            self._absorb(group, self._merged.pop(x)[1])
+        self._absorb(group, entity)
+
+    def _absorb(self, group, entity):
+        kind, merged, seen = self._merged[group]
+        if seen is None:
+            # Only worked out once there's something to merge
+            seen = {}
+            for x, v in merged._iter_fields():
+                if x in merged._repeatable_fields:
+                    seen[x] = set(_value_key(y) for y in v)
+            self._merged[group] = (kind, merged, seen)
+        for x, v in entity._iter_fields():
+            if x not in merged._repeatable_fields:
+                try:
+                    merged.get_field(x)
+                except KeyError:
+                    merged.set_field(x, _copy(v))
+                continue
+            keys = seen.setdefault(x, set())
+            for y in v:
+                key = _value_key(y)
+                if key not in keys:
+                    keys.add(key)
+                    merged.add_to_field(x, _copy(y))
+
+    def __iter__(self):
+        # (kind, entity) for every merged entity, kind by kind, each in the
+        # order it was first seen
+        merged = self._merged
+        for kind in self._order:
+            for group in self._order[kind]:
+                if group in merged:
+                    yield kind, merged[group][1]
+            for entity in self._unidentified[kind]:
+                yield kind, entity
+
+
+def iter_merged(records, spill=False, buckets=64, tmpdir=None):
+    # Yields (kind, entity) for every distinct entity across records (each a
+    # QremisRoot, Qremis or single entity). Objects, events, agents and
+    # rights which share any identifier are merged into one, as are
+    # relationships which share a relationshipIdentifier. Inputs aren't
+    # modified, merged entities are copies. Linear in the size of the input.
+    #
+    # With spill=True entities are written out to temporary files (in tmpdir)
+    # rather than held in memory, and merged a bucket at a time, so only the
+    # identifiers and one bucket's entities are in memory at once. Entities
+    # then come out bucket by bucket rather than in the order they were seen.
+    if not spill:
+        merger = _Merger()
+        for record in records:
+            for kind, entity in _iter_entities(record):
+                merger.add(kind, entity)
+        for x in merger:
+            yield x
+        return
+    groups = _Groups()
+    with tempfile.TemporaryDirectory(dir=tmpdir) as d:
+        # Every entity once, with its group as of when it was seen
+        entities_path = os.path.join(d, "entities")
+        with open(entities_path, "wb") as f:
+            for record in records:
+                for kind, entity in _iter_entities(record):
+                    keys = _identifier_keys(kind, entity)
+                    group = groups.add(keys)[0] if keys else -1
+                    f.write(json.dumps([kind, group]).encode("utf-8"))
+                    f.write(_SEPARATOR + entity.to_json() + b"\n")
+        # Then into buckets by final group, so every entity of a group
+        # lands in the same one
+        bucket_paths = [os.path.join(d, "bucket{}".format(i)) for i in range(buckets)]
+        bucket_files = [open(x, "wb") for x in bucket_paths]
+        try:
+            with open(entities_path, "rb") as f:
+                for i, line in enumerate(f):
+                    head, _, _ = line.partition(_SEPARATOR)
+                    group = json.loads(head.decode("utf-8"))[1]
+                    group = groups.find(group) if group >= 0 else i
+                    bucket_files[group % buckets].write(line)
+        finally:
+            for x in bucket_files:
+                x.close()
+        os.remove(entities_path)
+        del groups
+        for path in bucket_paths:
+            merger = _Merger()
+            with open(path, "rb") as f:
+                for line in f:
+                    head, _, body = line.partition(_SEPARATOR)
+                    kind = json.loads(head.decode("utf-8"))[0]
+                    entity = Qremis._child_types[kind].from_json(body, validate=False)
+                    merger.add(kind, entity, copy=False)
+            os.remove(path)
+            for x in merger:
+                yield x
+
+
+def merge(records, spill=False, buckets=64, tmpdir=None):
+    # A single Qremis of the merged entities of records - see iter_merged
+    fields = dict((x, []) for x in Qremis._identifier_fields)
+    for kind, entity in iter_merged(records, spill=spill, buckets=buckets, tmpdir=tmpdir):
+        fields[kind].append(entity)
+    return Qremis.construct(**dict((x, v) for x, v in fields.items() if v))
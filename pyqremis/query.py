@@ -0,0 +1,130 @@
+"""
+pyqremis.query
+
+Path queries, compiled once into traversal functions, over element trees or
+the dicts they're built from
+"""
+import re
+
+from . import Qremis, QremisElementMeta
+
+# fieldname, then optionally [*] or [index]
+_step_pattern = re.compile(r"^([A-Za-z_][A-Za-z0-9_]*)(?:\[(\*|-?[0-9]+)\])?$")
+
+
+def _parse(path, cls):
+    # "object[*].storage[0].contentLocation" -> [(fieldname, repeatable,
+    # None for every value or an index, type)], checked against the _spec of
+    # cls and its children. A repeatable field without a subscript is the
+    # same as [*].
+    steps = []
+    if not path:
+        return steps
+    for part in path.split("."):
+        m = _step_pattern.match(part)
+        if m is None:
+            raise ValueError("Can't parse {} in {}".format(part, path))
+        x, subscript = m.groups()
+        if not isinstance(cls, QremisElementMeta):
+            raise ValueError("{} continues past a leaf field".format(path))
+        if cls._freeform:
+            raise ValueError("{} continues into an extension".format(path))
+        if x not in cls._field_types:
+            raise ValueError("Erroneous field! - {} in {}".format(x, path))
+        repeatable = x in cls._repeatable_fields
+        if subscript is not None and not repeatable:
+            raise ValueError("{} isn't repeatable, in {}".format(x, path))
+        index = None if subscript in (None, "*") else int(subscript)
+        steps.append((x, repeatable, index, cls))
+        cls = cls._field_types[x]
+    return steps
+
+
+def _compile(steps, for_dicts):
+    # Generates a generator function of the root, one nested block per step,
+    # yielding whatever's found at the end of the path
+    namespace = {'missing': object()}
+    lines = ["def select(v0):"]
+    indent = "    "
+    for i, (x, repeatable, index, cls) in enumerate(steps):
+        v = "v{}".format(i)
+        w = "v{}".format(i + 1)
+        if for_dicts:
+            lines.append("{}{} = {}.get({!r}, missing)".format(indent, w, v, x))
+        else:
+            # Straight to the slot, building it first if it's still pending
+            # in a lazily loaded element
+            lines.extend([
+                "{}{} = getattr({}, {!r}, missing)".format(indent, w, v, cls._slot_names[x]),
+                "{}if {} is missing and {}._lazy is not None and {!r} in {}._lazy[1]:".format(
+                    indent, w, v, x, v
+                ),
+                "{}    {} = {}._materialize({!r})".format(indent, w, v, x)
+            ])
+        lines.append("{}if {} is not missing:".format(indent, w))
+        indent += "    "
+        if repeatable:
+            if index is None:
+                lines.append("{}for {} in {}:".format(indent, w, w))
+                indent += "    "
+            else:
+                lines.extend([
+                    "{}if -len({}) <= {} < len({}):".format(indent, w, index, w),
+                    "{}    {} = {}[{}]".format(indent, w, w, index)
+                ])
+                indent += "    "
+    lines.append("{}yield v{}".format(indent, len(steps)))
+    exec("\n".join(lines), namespace)
+    return namespace['select']
+
+
+class Query(object):
+    # A path such as "object[*].storage[*].contentLocation.contentLocationValue",
+    # relative to cls, checked against the _spec when it's created and
+    # compiled into a generator function on first use. Calling it with an
+    # instance of cls - or the dict from_dict would build one from - yields
+    # every match, elements or dicts along the way and strings at leaves.
+    # [*] (or no subscript) takes every value of a repeatable field, [n] (or
+    # [-n]) just one.
+
+    def __init__(self, path, cls=Qremis):
+        self.path = path
+        self.cls = cls
+        self._steps = _parse(path, cls)
+        # The type of what's matched - a QremisElement subclass, or str
+        if self._steps:
+            x, _, _, owner = self._steps[-1]
+            self.result_type = owner._field_types[x]
+        else:
+            self.result_type = cls
+        self._for_elements = None
+        self._for_dicts = None
+
+    def __repr__(self):
+        return "Query({!r}, cls={})".format(self.path, self.cls.__name__)
+
+    def __call__(self, root):
+        if isinstance(root, dict):
+            if self._for_dicts is None:
+                self._for_dicts = _compile(self._steps, True)
+            return self._for_dicts(root)
+        if not isinstance(root, self.cls):
+            raise TypeError("Expected {} or dict, got {}".format(
+                self.cls.__name__, type(root).__name__
+            ))
+        if self._for_elements is None:
+            self._for_elements = _compile(self._steps, False)
+        return self._for_elements(root)
+
+
+# (path, cls) -> Query, for select()
+_queries = {}
+
+
+def select(path, root, cls=Qremis):
+    # Query(path, cls)(root), reusing the compiled query for path
+    try:
+        query = _queries[path, cls]
+    except KeyError:
+        query = _queries[path, cls] = Query(path, cls)
+    return query(root)
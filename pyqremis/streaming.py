@@ -0,0 +1,217 @@
+"""
+pyqremis.streaming
+
+Tools for working with qremis records too large to hold in memory at once
+"""
+import json
+import xml.etree.ElementTree as ET
+from itertools import islice
+from multiprocessing import Pool
+
+from . import Qremis
+
+
+def iter_xml_entities(source, validate=True):
+    # Yields the Object, Event, Agent, Rights and Relationship instances
+    # found under the qremis element of source (a filename or file object)
+    # one at a time, discarding each subtree once it has been built so memory
+    # use is bounded by the largest entity rather than the whole file.
+    # The qremis element may be the document root or the child of a qremisRoot.
+    entity_types = Qremis._child_types
+    qremis = None
+    depth = 0
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if qremis is None and elem.tag == "qremis" and depth <= 2:
+                qremis = elem
+                qremis_depth = depth
+            continue
+        depth -= 1
+        if qremis is None or depth != qremis_depth:
+            continue
+        kls = entity_types.get(elem.tag)
+        if kls is None:
+            raise TypeError("Erroneous field! - {}".format(elem.tag))
+        entity = kls.from_xml_element(elem, validate=validate)
+        qremis.remove(elem)
+        yield entity
+
+
+def _iter_chunks(lines, chunksize):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _decode_chunk(args):
+    # Runs in the worker processes
+    cls, validate, func, lines = args
+    elements = (
+        cls.from_dict(json.loads(line), validate=validate) for line in lines if line.strip()
+    )
+    if func is None:
+        return list(elements)
+    return [func(x) for x in elements]
+
+
+def load_jsonl(source, cls=Qremis, chunksize=1000, workers=None, ordered=None, validate=True,
+               func=None):
+    # Yields a cls instance for every line of a JSON Lines file (a filename
+    # or a file object), or with func, func(instance) for every line.
+    #
+    # Lines are read in chunks of chunksize. Given a func, the json.loads +
+    # from_dict + func of each chunk is farmed out to a pool of worker
+    # processes (workers defaults to one per core; 1 runs in this process) and
+    # only func's results come back, so func should return something small -
+    # a fingerprint, a count, a few fields - and be picklable (a module level
+    # function, or a method of an element class). With ordered=False results
+    # are yielded as soon as any chunk finishes.
+    #
+    # Without func elements are always decoded in this process: shipping
+    # whole trees back from workers costs more to unpickle than decoding the
+    # lines here, so a pool would only make loading slower. workers and
+    # ordered mean nothing then, and passing them is an error.
+    if func is None and (workers is not None or ordered is not None):
+        raise ValueError("workers and ordered only apply with a func")
+    return _load_jsonl(source, cls, chunksize, workers, ordered is not False, validate, func)
+
+
+def _load_jsonl(source, cls, chunksize, workers, ordered, validate, func):
+    # The generator behind load_jsonl, so its arguments are checked when
+    # it's called rather than on the first next()
+    if isinstance(source, str):
+        with open(source, "r") as f:
+            for x in _load_jsonl(f, cls, chunksize, workers, ordered, validate, func):
+                yield x
+        return
+    tasks = ((cls, validate, func, chunk) for chunk in _iter_chunks(source, chunksize))
+    if func is None or workers == 1:
+        for chunk in map(_decode_chunk, tasks):
+            for x in chunk:
+                yield x
+        return
+    with Pool(workers) as pool:
+        if ordered:
+            results = pool.imap(_decode_chunk, tasks)
+        else:
+            results = pool.imap_unordered(_decode_chunk, tasks)
+        for chunk in results:
+            for x in chunk:
+                yield x
+
+
+class _BatchWriter:
+    # Buffers serialized entities and writes them out batch_size at a time.
+    # Takes a filename (which it opens, and closes again) or a file object.
+    # Subclasses define _serialize(entity), returning bytes.
+    _mode = "wb"
+
+    def __init__(self, f, batch_size=100):
+        if isinstance(f, str):
+            self._file = open(f, self._mode)
+            self._owns_file = True
+        else:
+            self._file = f
+            self._owns_file = False
+        self.batch_size = batch_size
+        self.count = 0
+        self.closed = False
+        self._buffered = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write(self, data):
+        self._file.write(data)
+
+    def write(self, entity):
+        if self.closed:
+            raise ValueError("Writer is closed")
+        self._buffered.append(self._serialize(entity))
+        self.count += 1
+        if len(self._buffered) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffered:
+            self._write(b"".join(self._buffered))
+            self._buffered = []
+        if hasattr(self._file, "flush"):
+            self._file.flush()
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        if self._owns_file:
+            self._file.close()
+
+
+class XmlWriter(_BatchWriter):
+    # Writes a qremis XML document one Object, Event, Agent, Rights or
+    # Relationship at a time. The root element is opened with the first
+    # batch and closed by close() (or leaving a with block), and is wrapped in
+    # a qremisRoot unless qremis_root is False. Entities are written in the
+    # order they arrive.
+    # The encoding works as it does for write_xml, "unicode" (for text files)
+    # excepted.
+
+    def __init__(self, f, batch_size=100, encoding="us-ascii", qremis_root=True):
+        super().__init__(f, batch_size=batch_size)
+        self.encoding = encoding
+        self.qremis_root = qremis_root
+        self._opened = False
+
+    def _encode(self, text):
+        return text.encode(self.encoding, "xmlcharrefreplace")
+
+    def _serialize(self, entity):
+        if entity._xml_tag not in Qremis._child_types or \
+                not isinstance(entity, Qremis._child_types[entity._xml_tag]):
+            raise TypeError("Only qremis entities can be written, not {}".format(
+                type(entity).__name__))
+        return self._encode("".join(entity.iter_xml_chunks()))
+
+    def _write(self, data):
+        if not self._opened:
+            self._open()
+        super()._write(data)
+
+    def _open(self, empty=False):
+        self._opened = True
+        if self.encoding.lower() not in ("utf-8", "us-ascii"):
+            super()._write(self._encode(
+                "<?xml version='1.0' encoding='{}'?>\n".format(self.encoding)))
+        if empty:
+            # Nothing was written, so match ElementTree's empty element
+            opening = "<qremisRoot><qremis /></qremisRoot>" if self.qremis_root else "<qremis />"
+        else:
+            opening = "<qremisRoot><qremis>" if self.qremis_root else "<qremis>"
+        super()._write(self._encode(opening))
+
+    def close(self):
+        if self.closed:
+            return
+        if self.count == 0:
+            self._open(empty=True)
+        else:
+            self._buffered.append(self._encode(
+                "</qremis></qremisRoot>" if self.qremis_root else "</qremis>"))
+        super().close()
+
+
+class JsonlWriter(_BatchWriter):
+    # Writes any elements (Qremis records, or their entities) to a JSON Lines
+    # file, one per line, via to_json. Filenames are opened for appending.
+    _mode = "ab"
+
+    def _serialize(self, entity):
+        return entity.to_json() + b"\n"
@@ -21,6 +21,9 @@ setup(
     url='https://github.com/bnbalsamo/pyqremis',
     install_requires=[
     ],
+    extras_require={
+        'orjson': ['orjson']
+    },
     tests_require=[
         'pytest'
     ],
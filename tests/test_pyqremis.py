@@ -1,7 +1,87 @@
+"""
+Unit tests for pyqremis
+"""
+import sys
 import unittest
 import pyqremis
 
 
+def make_object_dict(i):
+    return {
+        'objectIdentifier': [
+            {'objectIdentifierType': 'uuid', 'objectIdentifierValue': 'obj{}'.format(i)}
+        ],
+        'objectCategory': 'file',
+        'objectCharacteristics': [
+            {
+                'fixity': [
+                    {'messageDigestAlgorithm': 'md5', 'messageDigest': 'digest{}'.format(i % 3)}
+                ],
+                'format': [{'formatDesignation': {'formatName': 'text/plain'}}],
+                'objectCharacteristicsExtension': [{'note': ['extended']}]
+            }
+        ],
+        'storage': [
+            {
+                'contentLocation': {
+                    'contentLocationType': 'path',
+                    'contentLocationValue': '/data/{}'.format(i)
+                }
+            }
+        ],
+        'linkingRelationshipIdentifier': [
+            {
+                'linkingRelationshipIdentifierType': 'uuid',
+                'linkingRelationshipIdentifierValue': 'rel{}'.format(i)
+            }
+        ]
+    }
+
+
+def make_event_dict(i):
+    return {
+        'eventIdentifier': [
+            {'eventIdentifierType': 'uuid', 'eventIdentifierValue': 'evt{}'.format(i)}
+        ],
+        'eventType': 'ingest',
+        'eventDateTime': '2017-01-01T00:00:00',
+        'linkingRelationshipIdentifier': [
+            {
+                'linkingRelationshipIdentifierType': 'uuid',
+                'linkingRelationshipIdentifierValue': 'rel{}'.format(i)
+            }
+        ]
+    }
+
+
+def make_relationship_dict(i):
+    return {
+        'relationshipIdentifier': [
+            {'relationshipIdentifierType': 'uuid', 'relationshipIdentifierValue': 'rel{}'.format(i)}
+        ],
+        'relationshipType': 'link',
+        'relationshipSubType': 'subjectToEvent',
+        'linkingObjectIdentifier': [
+            {'linkingObjectIdentifierType': 'uuid',
+             'linkingObjectIdentifierValue': 'obj{}'.format(i)}
+        ],
+        'linkingEventIdentifier': [
+            {'linkingEventIdentifierType': 'uuid',
+             'linkingEventIdentifierValue': 'evt{}'.format(i)}
+        ]
+    }
+
+
+def make_record_dict(n=3):
+    return {
+        'qremis': {
+            'object': [make_object_dict(i) for i in range(n)],
+            'event': [make_event_dict(i) for i in range(n)],
+            'relationship': [make_relationship_dict(i) for i in range(n)]
+        }
+    }
+
+
 class Tests(unittest.TestCase):
     def testPass(self):
         self.assertEqual(True, True)
@@ -10,6 +90,925 @@ class Tests(unittest.TestCase):
         x = getattr(pyqremis, "__version__", None)
         self.assertTrue(x is not None)
 
+    def testDictRoundTrip(self):
+        d = make_record_dict()
+        self.assertEqual(pyqremis.QremisRoot.from_dict(d).to_dict(), d)
+
+    def testAccessorsAreClassLevel(self):
+        o = pyqremis.Object.from_dict(make_object_dict(0))
+        for name in ("get_objectCategory", "set_objectCategory",
+                     "del_objectCategory", "add_objectIdentifier"):
+            self.assertTrue(hasattr(pyqremis.Object, name))
+            self.assertNotIn(name, getattr(o, "__dict__", {}))
+        self.assertFalse(hasattr(pyqremis.Object, "add_objectCategory"))
+
+    def testProperties(self):
+        o = pyqremis.Object.from_dict(make_object_dict(0))
+        self.assertEqual(o.objectCategory, 'file')
+        o.objectCategory = 'directory'
+        self.assertEqual(o.get_objectCategory(), 'directory')
+        with self.assertRaises(TypeError):
+            o.objectCategory = 1
+        ident = pyqremis.ObjectIdentifier(objectIdentifierType='a', objectIdentifierValue='b')
+        o.objectIdentifier = [ident]
+        self.assertEqual(o.objectIdentifier, [ident])
+        del o.storage
+        with self.assertRaises(KeyError):
+            o.get_storage()
+
+    def testSlotStorage(self):
+        o = pyqremis.Object.from_dict(make_object_dict(0))
+        self.assertFalse(hasattr(o, "__dict__"))
+        self.assertEqual(o._fields['objectCategory'], 'file')
+        ext = o.get_objectCharacteristics()[0].get_objectCharacteristicsExtension()[0]
+        self.assertFalse(hasattr(ext, "__dict__"))
+        self.assertEqual(ext.get_field('note'), ['extended'])
+        with self.assertRaises(TypeError):
+            o.set_field('notAField', 'x')
+
+    def testCompiledSpecTables(self):
+        self.assertEqual(pyqremis.Object._mandatory_fields,
+                         frozenset(['objectIdentifier', 'objectCategory', 'objectCharacteristics']))
+        self.assertIn('storage', pyqremis.Object._repeatable_fields)
+        self.assertNotIn('originalName', pyqremis.Object._repeatable_fields)
+        self.assertIs(pyqremis.Object._child_types['storage'], pyqremis.Storage)
+        self.assertNotIn('objectCategory', pyqremis.Object._child_types)
+        with self.assertRaises(ValueError):
+            pyqremis.Object(objectCategory='file')
+
+    def testTrustedConstruction(self):
+        d = make_record_dict()
+        trusted = pyqremis.QremisRoot.from_dict(d, validate=False)
+        self.assertEqual(trusted.to_dict(), d)
+        self.assertEqual(trusted, pyqremis.QremisRoot.from_dict(d))
+        # No checks are made - that's the point
+        o = pyqremis.Object.construct(objectCategory='file')
+        self.assertEqual(o.to_dict(), {'objectCategory': 'file'})
+        ident = pyqremis.ObjectIdentifier.construct(objectIdentifierType='a',
+                                                    objectIdentifierValue='b')
+        o = pyqremis.Object.construct(ident, objectCategory='file')
+        self.assertEqual(o.get_objectIdentifier(), [ident])
+        ext = pyqremis.ObjectExtension.construct(foo='bar')
+        self.assertEqual(ext.to_dict(), {'foo': ['bar']})
+        # Every trusted path drops fields outside the spec the same way
+        import xml.etree.ElementTree as ET
+        d = {'objectCategory': 'file', 'bogus': 'x'}
+        for o in (pyqremis.Object.from_dict(d, validate=False),
+                  pyqremis.Object.from_dict(d, validate=False, lazy=True),
+                  pyqremis.Object.from_xml_element(ET.fromstring(
+                      "<object><objectCategory>file</objectCategory><bogus>x</bogus></object>"
+                  ), validate=False)):
+            self.assertEqual(o.to_dict(), {'objectCategory': 'file'})
+
+    def testLazyFromDict(self):
+        d = make_object_dict(0)
+        o = pyqremis.Object.from_dict(d, lazy=True)
+        self.assertEqual(o.get_objectCategory(), 'file')
+        self.assertIn('storage', o._lazy[1])
+        self.assertEqual(o.get_objectIdentifier()[0].get_objectIdentifierValue(), 'obj0')
+        self.assertNotIn('objectIdentifier', o._lazy[1])
+        self.assertIn('storage', o._lazy[1])
+        self.assertEqual(o.to_dict(), d)
+        self.assertIsNone(o._lazy)
+        # Replacing or deleting a pending field discards the raw value
+        o = pyqremis.Object.from_dict(d, lazy=True)
+        o.del_storage()
+        o.set_linkingRelationshipIdentifier([])
+        self.assertNotIn('storage', o.to_dict())
+        self.assertNotIn('linkingRelationshipIdentifier', o.to_dict())
+        # Validation of children happens when they are reached
+        bad = make_object_dict(0)
+        bad['storage'] = [{'notAField': 'x'}]
+        o = pyqremis.Object.from_dict(bad, lazy=True)
+        with self.assertRaises(TypeError):
+            o.get_storage()
+        with self.assertRaises(ValueError):
+            pyqremis.Object.from_dict({'objectCategory': 'file'}, lazy=True)
+        root = pyqremis.QremisRoot.from_dict(make_record_dict(), validate=False, lazy=True)
+        self.assertEqual(root.to_dict(), make_record_dict())
+
+    def testXmlRoundTrip(self):
+        import xml.etree.ElementTree as ET
+        d = make_record_dict()
+        d['qremis']['object'][0]['objectExtension'] = [
+            {'nested': [{'deeper': ['a', 'b']}], 'flat': ['c']}
+        ]
+        root = pyqremis.QremisRoot.from_dict(d)
+        e = ET.fromstring(ET.tostring(root.to_xml_element()))
+        self.assertEqual(pyqremis.QremisRoot.from_xml_element(e).to_dict(), d)
+        self.assertEqual(pyqremis.QremisRoot.from_xml_element(e, validate=False).to_dict(), d)
+        with self.assertRaises(ValueError):
+            pyqremis.Qremis.from_xml_element(e)
+        with self.assertRaises(TypeError):
+            pyqremis.ContentLocation.from_xml_element(ET.fromstring(
+                "<contentLocation><bogus>x</bogus></contentLocation>"
+            ))
+
+    def testIterXmlEntities(self):
+        import xml.etree.ElementTree as ET
+        from io import BytesIO
+        from pyqremis.streaming import iter_xml_entities
+        d = make_record_dict()
+        root = pyqremis.QremisRoot.from_dict(d)
+        for e in (root.to_xml_element(), root.get_qremis().to_xml_element()):
+            entities = list(iter_xml_entities(BytesIO(ET.tostring(e))))
+            self.assertEqual(len(entities), 9)
+            self.assertEqual(
+                [x.to_dict() for x in entities if isinstance(x, pyqremis.Object)],
+                d['qremis']['object']
+            )
+            self.assertIsInstance(entities[-1], pyqremis.Relationship)
+
+    def testGeneratedDecoders(self):
+        d = make_object_dict(0)
+        o = pyqremis.Object.from_dict(d)
+        self.assertEqual(o.to_dict(), d)
+        self.assertIs(pyqremis.Object._decoder(True), pyqremis.Object._decoder(True))
+        for bad, exc in [
+            ({}, ValueError),
+            (dict(d, bogus='x'), TypeError),
+            (dict(d, objectCategory=1), TypeError),
+            (dict((k, v) for k, v in d.items() if k != 'objectCategory'), ValueError),
+            (dict(d, storage=[{'contentLocation': {'contentLocationType': 'x'}}]), ValueError)
+        ]:
+            with self.assertRaises(exc):
+                pyqremis.Object.from_dict(bad)
+        ext = pyqremis.ExtensionElement.from_dict({'a': ['b']})
+        self.assertEqual(ext.to_dict(), {'a': ['b']})
+
+    def testLoadJsonl(self):
+        import json
+        from io import StringIO
+        from pyqremis.streaming import load_jsonl
+        records = [make_record_dict(1)['qremis'] for _ in range(2)] + \
+            [{'object': [make_object_dict(i)]} for i in range(5)]
+        text = "\n".join(json.dumps(x) for x in records) + "\n\n"
+        loaded = list(load_jsonl(StringIO(text), chunksize=2))
+        self.assertEqual([x.to_dict() for x in loaded], records)
+        fingerprints = [pyqremis.Qremis.from_dict(x).fingerprint() for x in records]
+        for workers in (1, 2):
+            results = list(load_jsonl(StringIO(text), chunksize=2, workers=workers,
+                                      func=pyqremis.Qremis.fingerprint))
+            self.assertEqual(results, fingerprints)
+        results = load_jsonl(StringIO(text), chunksize=3, workers=2, ordered=False,
+                             func=pyqremis.Qremis.fingerprint)
+        self.assertEqual(sorted(results), sorted(fingerprints))
+        loaded = list(load_jsonl(StringIO(json.dumps(make_event_dict(0))),
+                                 cls=pyqremis.Event))
+        self.assertEqual(loaded[0].get_eventType(), 'ingest')
+        # Elements are always decoded in process, so a pool makes no sense
+        with self.assertRaises(ValueError):
+            load_jsonl(StringIO(text), workers=2)
+        with self.assertRaises(ValueError):
+            load_jsonl(StringIO(text), ordered=False)
+
+    def testJsonBackends(self):
+        import json
+        d = make_record_dict()
+        # Slashes (in the storage paths) and non-ASCII come out the same from
+        # every backend
+        d['qremis']['object'][0]['originalName'] = 'caf\xe9/\u2603'
+        root = pyqremis.QremisRoot.from_dict(d)
+        original = pyqremis.get_json_backend()
+        try:
+            outputs = set()
+            for backend in sorted(pyqremis._json_backends):
+                pyqremis.set_json_backend(backend)
+                self.assertEqual(pyqremis.get_json_backend(), backend)
+                b = root.to_json()
+                self.assertIsInstance(b, bytes)
+                self.assertEqual(json.loads(b.decode("utf-8")), d)
+                self.assertEqual(pyqremis.QremisRoot.from_json(b), root)
+                outputs.add(b)
+            self.assertEqual(len(outputs), 1)
+            with self.assertRaises(ValueError):
+                pyqremis.set_json_backend('no such backend')
+        finally:
+            pyqremis.set_json_backend(original)
+
+    def testWriteXml(self):
+        import xml.etree.ElementTree as ET
+        from io import BytesIO, StringIO
+        d = make_record_dict()
+        o = d['qremis']['object'][0]
+        o['originalName'] = 'caf\xe9 <&> "quoted"'
+        o['objectExtension'] = [{'nested': [{'deeper': ['a', '']}], 'empty': ['']}]
+        root = pyqremis.QremisRoot.from_dict(d)
+        for encoding in ("us-ascii", "utf-8", "latin-1"):
+            f = BytesIO()
+            root.write_xml(f, encoding=encoding, buffer_size=100)
+            self.assertEqual(f.getvalue(), ET.tostring(root.to_xml_element(), encoding=encoding))
+        f = StringIO()
+        root.write_xml(f, encoding="unicode")
+        self.assertEqual(f.getvalue(), ET.tostring(root.to_xml_element(), encoding="unicode"))
+        self.assertEqual("".join(root.iter_xml_chunks()), f.getvalue())
+
+    def testDeepTrees(self):
+        import sys
+        depth = sys.getrecursionlimit() * 2
+        e = pyqremis.ObjectExtension(leaf='x')
+        for _ in range(depth):
+            e = pyqremis.ObjectExtension.construct(child=e)
+        d = e.to_dict()
+        for _ in range(depth):
+            d = d['child'][0]
+        self.assertEqual(d, {'leaf': ['x']})
+        xml = e.to_xml_element()
+        self.assertEqual(len(list(xml.iter('objectExtension'))), depth + 1)
+        chunks = "".join(e.iter_xml_chunks())
+        self.assertTrue(chunks.startswith("<objectExtension><objectExtension>"))
+        self.assertEqual(chunks.count("<leaf>x</leaf>"), 1)
+
+    def testSerializationCaching(self):
+        import pickle
+        from pyqremis.diff import diff
+        root = pyqremis.QremisRoot.from_dict(make_record_dict())
+        j = root.to_json()
+        self.assertIs(root.to_json(), j)
+        b = root.to_bytes()
+        self.assertIs(root.to_bytes(), b)
+        x = root.to_xml_string()
+        self.assertIs(root.to_xml_string(), x)
+        objects = root.get_qremis().get_object()
+        location = objects[0].get_storage()[0].get_contentLocation()
+        location.set_contentLocationValue('/moved')
+        self.assertIn(b'/moved', root.to_json())
+        self.assertIn(b'/moved', root.to_bytes())
+        self.assertIn('/moved', root.to_xml_string())
+        objects[1].del_storage()
+        self.assertNotIn(b'"storage"', objects[1].to_json())
+        objects[2].add_objectIdentifier(pyqremis.ObjectIdentifier(
+            objectIdentifierType='a', objectIdentifierValue='b'))
+        self.assertIn(b'"objectIdentifierValue":"b"', root.to_json())
+        # to_dict() is cached too, but copied, so what it returns is the
+        # caller's to change
+        d = root.to_dict()
+        self.assertIn('dict', root._text_cache)
+        self.assertIsNot(root.to_dict(), d)
+        d['qremis']['object'][0]['objectCategory'] = 'changed'
+        d['qremis']['object'][0]['storage'].append({'storageMedium': 'tape'})
+        self.assertEqual(objects[0].get_objectCategory(), 'file')
+        self.assertEqual(root.to_dict()['qremis']['object'][0]['objectCategory'], 'file')
+        self.assertEqual(len(root.to_dict()['qremis']['object'][0]['storage']), 1)
+        # Lists changed in place invalidate like add_to_field
+        other = pyqremis.QremisRoot.from_dict(root.to_dict())
+        self.assertEqual(diff(root, other), [])
+        root.to_json()
+        objects[0].get_storage().append(pyqremis.Storage(storageMedium='tape'))
+        self.assertEqual(len(root.to_dict()['qremis']['object'][0]['storage']), 2)
+        self.assertIn(b'"storageMedium":"tape"', root.to_json())
+        self.assertNotEqual(root, other)
+        self.assertEqual(len(diff(root, other)), 1)
+        objects[0].get_storage()[1].set_storageMedium('disk')
+        self.assertIn(b'"storageMedium":"disk"', root.to_json())
+        del objects[0].get_storage()[1]
+        self.assertEqual(root, other)
+        self.assertEqual(diff(root, other), [])
+        # An element added in two places invalidates both
+        shared = pyqremis.ContentLocation(contentLocationType='a', contentLocationValue='b')
+        first = pyqremis.Storage(contentLocation=shared)
+        second = pyqremis.Storage(contentLocation=shared)
+        first.to_json(), second.to_json()
+        shared.set_contentLocationValue('c')
+        self.assertIn(b'"contentLocationValue":"c"', first.to_json())
+        self.assertIn(b'"contentLocationValue":"c"', second.to_json())
+        # Parents and caches aren't pickled, but are rebuilt
+        copied = pickle.loads(pickle.dumps(objects[0]))
+        self.assertIsNone(copied._parent)
+        self.assertEqual(copied.to_dict(), objects[0].to_dict())
+        copied.get_storage()[0].set_storageMedium('tape')
+        self.assertIn(b'"storageMedium":"tape"', copied.to_json())
+        copied.get_storage().append(pyqremis.Storage(storageMedium='disk'))
+        self.assertIn(b'"storageMedium":"disk"', copied.to_json())
+
+    def testBatchWriters(self):
+        import xml.etree.ElementTree as ET
+        from io import BytesIO
+        from pyqremis.streaming import JsonlWriter, XmlWriter, iter_xml_entities, load_jsonl
+        d = make_record_dict()
+        root = pyqremis.QremisRoot.from_dict(d)
+        # In the order to_xml_element() writes them, which is _spec order and
+        # so isn't fixed before Python 3.6
+        entities = [x for k, v in root.get_qremis()._iter_fields() for x in v]
+        for qremis_root, expected in ((True, root), (False, root.get_qremis())):
+            f = BytesIO()
+            with XmlWriter(f, batch_size=2, qremis_root=qremis_root) as writer:
+                for x in entities:
+                    writer.write(x)
+                self.assertLess(len(writer._buffered), 2)
+            self.assertEqual(f.getvalue(), ET.tostring(expected.to_xml_element()))
+            self.assertEqual(len(list(iter_xml_entities(BytesIO(f.getvalue())))), 9)
+        f = BytesIO()
+        XmlWriter(f, qremis_root=False).close()
+        self.assertEqual(f.getvalue(), b"<qremis />")
+        with self.assertRaises(TypeError):
+            XmlWriter(BytesIO()).write(root)
+        f = BytesIO()
+        with JsonlWriter(f, batch_size=4) as writer:
+            for x in root.get_qremis().get_object():
+                writer.write(x)
+        loaded = list(load_jsonl(BytesIO(f.getvalue()), cls=pyqremis.Object))
+        self.assertEqual([x.to_dict() for x in loaded], d['qremis']['object'])
+
+    def testBinaryRoundTrip(self):
+        d = make_record_dict()
+        d['qremis']['object'][0]['objectExtension'] = [
+            {'nested': [{'deeper': ['a', 'b']}], 'text': ['\u00e9' * 200]}
+        ]
+        root = pyqremis.QremisRoot.from_dict(d)
+        ext = root.get_qremis().get_object()[0].get_objectExtension()[0]
+        ext.add_to_field('element', pyqremis.ObjectExtension(leaf='x'))
+        b = root.to_bytes()
+        self.assertIs(root.to_bytes(), b)
+        self.assertLess(len(b), len(root.to_json()))
+        loaded = pyqremis.QremisRoot.from_bytes(b)
+        self.assertEqual(loaded.to_dict(), root.to_dict())
+        ext = loaded.get_qremis().get_object()[0].get_objectExtension()[0]
+        self.assertIsInstance(ext.get_field('element')[0], pyqremis.ObjectExtension)
+        # Decoded elements take part in cache invalidation
+        loaded.to_bytes()
+        loaded.get_qremis().get_object()[0].set_objectCategory('changed')
+        reloaded = pyqremis.QremisRoot.from_bytes(loaded.to_bytes())
+        self.assertEqual(reloaded.get_qremis().get_object()[0].get_objectCategory(), 'changed')
+        o = pyqremis.Object.from_bytes(root.get_qremis().get_object()[1].to_bytes())
+        self.assertEqual(o.to_dict(), d['qremis']['object'][1])
+        with self.assertRaises(ValueError):
+            pyqremis.Object.from_bytes(b)
+        with self.assertRaises(ValueError):
+            pyqremis.QremisRoot.from_bytes(b + b"\x00")
+        with self.assertRaises(ValueError):
+            pyqremis.QremisRoot.from_bytes(b"not binary")
+        # Corrupt input is a ValueError, however it's cut short
+        for end in (len(b) - 1, len(b) // 2, 12):
+            with self.assertRaisesRegex(ValueError, "Truncated"):
+                pyqremis.QremisRoot.from_bytes(b[:end])
+        # A field written twice
+        with self.assertRaisesRegex(ValueError, "repeated"):
+            pyqremis.Object.from_bytes(b'QRB\x01\x06object\x02\x05\x04file\x05\x03dir')
+        self.assertEqual(pyqremis.Object.from_bytes(
+            b'QRB\x01\x06object\x02\x05\x04file\x05\x03dir', validate=False
+        ).get_objectCategory(), 'dir')
+        # Field codes follow the names, not the order of the _spec dict, so
+        # they're the same in every process
+        for cls in pyqremis._element_classes.values():
+            if hasattr(cls, '_spec') and not cls._freeform:
+                self.assertEqual([x[0] for x in cls._fields_by_code], sorted(cls._spec))
+        self.assertEqual(pyqremis.Object.construct(objectCategory='file').to_bytes(),
+                         b'QRB\x01\x06object\x01\x05\x04file')
+        # Drop the mandatory objectCategory
+        o = pyqremis.Object.construct(
+            objectIdentifier=root.get_qremis().get_object()[0].get_objectIdentifier()
+        )
+        with self.assertRaises(ValueError):
+            pyqremis.Object.from_bytes(o.to_bytes())
+        self.assertEqual(
+            pyqremis.Object.from_bytes(o.to_bytes(), validate=False).to_dict(), o.to_dict()
+        )
+
+    def testFingerprint(self):
+        d = make_record_dict(4)
+        root = pyqremis.QremisRoot.from_dict(d)
+        fingerprint = root.fingerprint()
+        self.assertEqual(len(fingerprint), 64)
+        self.assertEqual(root.fingerprint(), fingerprint)
+        # Repeatable values and extension fields in another order
+        d['qremis']['object'].reverse()
+        d['qremis']['object'][0]['objectExtension'] = [{'b': ['2', '1'], 'a': 'x'}]
+        reordered = pyqremis.QremisRoot.from_dict(d)
+        d['qremis']['object'][0]['objectExtension'] = [{'a': ['x'], 'b': ['1', '2']}]
+        root = pyqremis.QremisRoot.from_dict(d)
+        self.assertEqual(reordered.fingerprint(), root.fingerprint())
+        self.assertEqual(reordered.to_canonical_json(), root.to_canonical_json())
+        self.assertEqual(
+            pyqremis.QremisRoot.from_json(root.to_canonical_json()).fingerprint(),
+            root.fingerprint()
+        )
+        # A change is seen, and only rehashes what's above it
+        objects = root.get_qremis().get_object()
+        fingerprint = root.fingerprint()
+        untouched = objects[1]._text_cache['digest']
+        objects[0].set_objectCategory('changed')
+        self.assertIsNone(root._text_cache)
+        self.assertIs(objects[1]._text_cache['digest'], untouched)
+        self.assertNotEqual(root.fingerprint(), fingerprint)
+        self.assertNotEqual(root.to_canonical_json(), reordered.to_canonical_json())
+        # The class is part of the fingerprint
+        ext = pyqremis.ObjectExtension(a='x')
+        self.assertNotEqual(ext.fingerprint(), pyqremis.EventExtension(a='x').fingerprint())
+        self.assertEqual(
+            ext.fingerprint(), pyqremis.ObjectExtension.from_dict({'a': ['x']}).fingerprint()
+        )
+
+    def testEquality(self):
+        import pickle
+        d = make_record_dict(4)
+        a = pyqremis.QremisRoot.from_dict(d)
+        b = pyqremis.QremisRoot.from_dict(d)
+        self.assertEqual(a, b)
+        self.assertEqual(pyqremis.QremisRoot.from_dict(d, lazy=True), a)
+        self.assertNotEqual(a, d)
+        self.assertNotEqual(a.get_qremis(), a)
+        # Same fields, different classes
+        self.assertNotEqual(pyqremis.ObjectExtension(a='x'), pyqremis.EventExtension(a='x'))
+        self.assertEqual(pyqremis.ObjectExtension(a=['x']), pyqremis.ObjectExtension(a=('x',)))
+        # Order of repeatable values matters to equality
+        d['qremis']['object'].reverse()
+        c = pyqremis.QremisRoot.from_dict(d)
+        self.assertNotEqual(a, c)
+        # Cached digests short circuit
+        a.fingerprint()
+        b.fingerprint()
+        self.assertEqual(a, b)
+        b.get_qremis().get_object()[-1].set_objectCategory('changed')
+        self.assertNotEqual(a, b)
+        b.get_qremis().get_object()[-1].set_objectCategory('file')
+        self.assertEqual(a, b)
+        # Only frozen elements are hashable, as a changed element would be
+        # lost from the sets and dicts holding it
+        with self.assertRaises(TypeError):
+            hash(a)
+        lazy = pyqremis.QremisRoot.from_dict(make_record_dict(4), lazy=True)
+        self.assertIs(a.freeze(), a)
+        self.assertEqual(hash(a), hash(lazy.freeze()))
+        self.assertEqual(hash(a), hash(c.freeze()))
+        self.assertNotEqual(hash(a), hash(pyqremis.QremisRoot.from_dict(
+            make_record_dict(3)
+        ).freeze()))
+        obj = a.get_qremis().get_object()[0]
+        for change in (lambda: obj.set_objectCategory('changed'),
+                       lambda: obj.del_storage(),
+                       lambda: obj.add_storage(pyqremis.Storage(storageMedium='tape')),
+                       lambda: obj.get_storage().append(pyqremis.Storage(storageMedium='tape')),
+                       lambda: obj.get_storage().pop(),
+                       lambda: obj.get_storage()[0].set_storageMedium('tape')):
+            with self.assertRaises(TypeError):
+                change()
+        self.assertEqual(a, b)
+        # Usable as dict keys and set members, pickled sets included
+        seen = set(a.get_qremis().get_object())
+        self.assertEqual(len(seen), 4)
+        self.assertIn(pyqremis.Object.from_dict(make_object_dict(2)).freeze(), seen)
+        self.assertEqual(pickle.loads(pickle.dumps(seen)), seen)
+        # A copy through to_dict can be changed
+        thawed = pyqremis.Object.from_dict(obj.to_dict())
+        thawed.set_objectCategory('changed')
+
+    def testValidate(self):
+        d = make_record_dict(4)
+        self.assertEqual(pyqremis.QremisRoot.from_dict(d).validate(), [])
+        objects = d['qremis']['object']
+        del objects[3]['storage'][0]['contentLocation']['contentLocationValue']
+        del objects[1]['objectCategory']
+        objects[1]['objectCharacteristics'][0]['fixity'][0]['messageDigest'] = 1
+        objects[2]['objectCharacteristics'][0]['fixity'] = []
+        root = pyqremis.QremisRoot.from_dict(d, validate=False)
+        root.get_qremis().get_object()[0].storage[0]._contentLocation = [
+            pyqremis.ContentLocation(contentLocationType='a', contentLocationValue='b')
+        ]
+        characteristics = root.get_qremis().get_object()[2].objectCharacteristics[0]
+        characteristics._format = pyqremis.Fixity.construct()
+        self.assertEqual(root.validate(), [
+            ('qremis.object[0].storage[0].contentLocation', "Non-repeatable field repeated!"),
+            ('qremis.object[1].objectCategory', "Required, but not present"),
+            ('qremis.object[1].objectCharacteristics[0].fixity[0].messageDigest',
+             "Expected str, got int"),
+            ('qremis.object[2].objectCharacteristics[0].format', "Repeatable field isn't a list"),
+            ('qremis.object[3].storage[0].contentLocation.contentLocationValue',
+             "Required, but not present"),
+        ])
+        ext = pyqremis.ObjectExtension.construct(a=[pyqremis.Fixity.construct(), 1])
+        self.assertEqual(ext.validate(), [
+            ('a[1]', "Expected str, dict or element, got int"),
+            ('a[0]', "No empty elements!"),
+            ('a[0].messageDigestAlgorithm', "Required, but not present"),
+            ('a[0].messageDigest', "Required, but not present"),
+        ])
+        # Deeper than the recursion limit
+        deep = pyqremis.ObjectExtension(leaf='x')
+        for _ in range(sys.getrecursionlimit() + 100):
+            deep = pyqremis.ObjectExtension.construct(child=deep)
+        self.assertEqual(deep.validate(), [])
+        # Eager validation stops at the first
+        with self.assertRaises(ValueError):
+            pyqremis.QremisRoot.from_dict(d)
+        # from_dict(validate="defer") keeps what doesn't fit the spec for
+        # validate(), which describes it as validate_dict() does
+        for bad in (
+            {'qremis': {'object': [{'objectCategory': 'x', 'bogus': 'y'}]}},
+            {'qremis': {'object': make_object_dict(0)}},
+            {'qremis': {'object': [dict(make_object_dict(0), storage=['oops'])]}},
+            {'qremis': [{'object': [make_object_dict(0)]}]},
+            {'qremis': {'object': [dict(make_object_dict(0), objectCategory=['file'])],
+                        'event': [dict(make_event_dict(0), eventExtension=[{'a': 'b'}])]}},
+        ):
+            root = pyqremis.QremisRoot.from_dict(bad, validate="defer")
+            self.assertTrue(root.validate())
+            self.assertEqual(sorted(root.validate()), sorted(pyqremis.validate_dict(bad)))
+        root = pyqremis.QremisRoot.from_dict(
+            {'qremis': {'object': [{'objectCategory': 'x', 'bogus': 'y'}]}}, validate="defer"
+        )
+        self.assertEqual(root.validate(), [
+            ('qremis.object[0].bogus', "Erroneous field!"),
+            ('qremis.object[0].objectIdentifier', "Required, but not present"),
+            ('qremis.object[0].objectCharacteristics', "Required, but not present"),
+        ])
+        # Set aside fields read as absent, and go once replaced or deleted
+        obj = root.get_qremis().get_object()[0]
+        self.assertEqual(obj.to_dict(), {'objectCategory': 'x'})
+        obj.del_field('bogus')
+        good = pyqremis.Object.from_dict(make_object_dict(0))
+        obj.set_objectIdentifier(good.get_objectIdentifier())
+        obj.set_objectCharacteristics(good.get_objectCharacteristics())
+        self.assertEqual(root.validate(), [])
+        root = pyqremis.QremisRoot.from_dict(
+            {'qremis': {'object': [dict(make_object_dict(0), storage=['oops'])]}},
+            validate="defer"
+        )
+        self.assertEqual(root.validate(), [
+            ('qremis.object[0].storage[0]', "Expected dict, got str")
+        ])
+        root.get_qremis().get_object()[0].set_storage([])
+        self.assertEqual(root.validate(), [])
+        # Valid input comes out the same as from_dict, and stays known to be
+        # valid until it changes
+        d = make_record_dict(4)
+        root = pyqremis.QremisRoot.from_dict(d, validate="defer")
+        self.assertEqual(root.to_dict(), d)
+        self.assertEqual(root.validate(), [])
+        root.get_qremis().get_object()[1].del_objectCategory()
+        self.assertEqual(root.validate(), [
+            ('qremis.object[1].objectCategory', "Required, but not present")
+        ])
+        with self.assertRaises(ValueError):
+            pyqremis.QremisRoot.from_dict(d, validate="defer", lazy=True)
+
+    def testValidateDict(self):
+        d = make_record_dict(4)
+        self.assertEqual(pyqremis.validate_dict(d), [])
+        self.assertEqual(pyqremis.validate_dict(d['qremis']['object'][0], cls=pyqremis.Object), [])
+        objects = d['qremis']['object']
+        del objects[3]['storage'][0]['contentLocation']['contentLocationValue']
+        del objects[1]['objectCategory']
+        objects[1]['objectCharacteristics'][0]['fixity'][0]['messageDigest'] = 1
+        objects[0]['storage'][0]['contentLocation'] = [objects[0]['storage'][0]['contentLocation']]
+        objects[2]['objectCharacteristics'][0]['format'] = {}
+        objects[2]['objectCharacteristics'][0]['fixity'] = ['digest']
+        objects[2]['objectExtension'] = [{'a': 'b', 'c': [1]}, {}]
+        objects[2]['unknown'] = 'x'
+        self.assertEqual(pyqremis.validate_dict(d), [
+            ('qremis.object[0].storage[0].contentLocation', "Non-repeatable field repeated!"),
+            ('qremis.object[1].objectCategory', "Required, but not present"),
+            ('qremis.object[1].objectCharacteristics[0].fixity[0].messageDigest',
+             "Expected str, got int"),
+            ('qremis.object[2].unknown', "Erroneous field!"),
+            ('qremis.object[2].objectCharacteristics[0].format', "Repeatable field isn't a list"),
+            ('qremis.object[2].objectCharacteristics[0].fixity[0]', "Expected dict, got str"),
+            ('qremis.object[2].objectExtension[0].a', "Repeatable field isn't a list"),
+            ('qremis.object[2].objectExtension[0].c[0]', "Expected str or dict, got int"),
+            ('qremis.object[2].objectExtension[1]', "No empty elements!"),
+            ('qremis.object[3].storage[0].contentLocation.contentLocationValue',
+             "Required, but not present"),
+        ])
+        deferred = pyqremis.QremisRoot.from_dict(d, validate="defer")
+        self.assertEqual(sorted(deferred.validate()), sorted(pyqremis.validate_dict(d)))
+        self.assertEqual(pyqremis.validate_dict([]), [('', "Expected dict, got list")])
+        o = make_object_dict(0)
+        o['objectIdentifier'] = []
+        o['storage'] = []
+        self.assertEqual(pyqremis.validate_dict(o, cls=pyqremis.Object), [
+            ('objectIdentifier', "Required, but not present")
+        ])
+
+    def testIdentifierIndex(self):
+        import pickle
+        root = pyqremis.QremisRoot.from_dict(make_record_dict(4))
+        qremis = root.get_qremis()
+        objects = qremis.get_object()
+        self.assertIs(qremis.get_entity_by_identifier('uuid', 'obj2'), objects[2])
+        self.assertIs(qremis.get_entity_by_identifier('uuid', 'rel3'), qremis.get_relationship()[3])
+        with self.assertRaises(KeyError):
+            qremis.get_entity_by_identifier('uuid', 'obj9')
+        # Added to in place
+        index = qremis._identifier_index
+        obj = pyqremis.Object.from_dict(make_object_dict(9))
+        qremis.add_object(obj)
+        self.assertIs(qremis._identifier_index, index)
+        self.assertIs(qremis.get_entity_by_identifier('uuid', 'obj9'), obj)
+        # Changes to identifiers are seen
+        obj.get_objectIdentifier()[0].set_objectIdentifierValue('renamed')
+        self.assertIsNone(qremis._identifier_index)
+        self.assertIs(qremis.get_entity_by_identifier('uuid', 'renamed'), obj)
+        with self.assertRaises(KeyError):
+            qremis.get_entity_by_identifier('uuid', 'obj9')
+        qremis.del_object(0)
+        with self.assertRaises(KeyError):
+            qremis.get_entity_by_identifier('uuid', 'obj0')
+        # Not part of the element's value
+        copied = pickle.loads(pickle.dumps(qremis))
+        self.assertEqual(copied, qremis)
+        self.assertIsNone(getattr(copied, '_identifier_index', None))
+        self.assertIs(copied.get_entity_by_identifier('uuid', 'obj1'), copied.get_object()[0])
+        # Entities of different kinds can share an identifier
+        event = pyqremis.Event.from_dict(make_event_dict(1))
+        event.get_eventIdentifier()[0].set_eventIdentifierValue('obj1')
+        copied.add_event(event)
+        self.assertIs(copied.get_entity_by_identifier('uuid', 'obj1', kind='event'), event)
+        self.assertIs(copied.get_entity_by_identifier('uuid', 'obj1', kind='object'),
+                      copied.get_object()[0])
+        with self.assertRaises(ValueError):
+            copied.get_entity_by_identifier('uuid', 'obj1')
+        with self.assertRaises(KeyError):
+            copied.get_entity_by_identifier('uuid', 'obj1', kind='agent')
+        copied._identifier_index = None
+        self.assertIs(copied.get_entity_by_identifier('uuid', 'obj1', kind='event'), event)
+
+    def testRelationshipGraph(self):
+        from pyqremis.graph import RelationshipGraph
+        root = pyqremis.QremisRoot.from_dict(make_record_dict(3))
+        graph = RelationshipGraph([root])
+        obj1 = ('object', 'uuid', 'obj1')
+        obj2 = ('object', 'uuid', 'obj2')
+        evt1 = ('event', 'uuid', 'evt1')
+        evt2 = ('event', 'uuid', 'evt2')
+        rel1 = ('relationship', 'uuid', 'rel1')
+        agent1 = ('agent', 'uuid', 'agent1')
+        alias1 = ('object', 'uuid', 'alias1')
+        self.assertEqual(len(graph), 9)
+        self.assertEqual(graph.kind(rel1), 'relationship')
+        self.assertEqual(graph.linked(obj1), [evt1])
+        self.assertEqual(graph.linked(obj1, kind='agent'), [])
+        self.assertEqual(graph.links(evt1), [rel1])
+        self.assertEqual(graph.linked(rel1, kind='object'), [obj1])
+        self.assertIs(graph.entity(obj1), root.get_qremis().get_object()[1])
+        self.assertIsNone(graph.path(obj1, obj2))
+        with self.assertRaises(KeyError):
+            graph.kind(('event', 'uuid', 'obj1'))
+        # A relationship, added first, linking an agent and obj1 by an
+        # identifier which only turns up later
+        relationship = make_relationship_dict(9)
+        del relationship['linkingEventIdentifier']
+        relationship['linkingObjectIdentifier'][0]['linkingObjectIdentifierValue'] = 'alias1'
+        relationship['linkingAgentIdentifier'] = [
+            {'linkingAgentIdentifierType': 'uuid', 'linkingAgentIdentifierValue': 'agent1'}
+        ]
+        relationship['linkingObjectIdentifier'].append(
+            {'linkingObjectIdentifierType': 'uuid', 'linkingObjectIdentifierValue': 'obj2'}
+        )
+        graph = RelationshipGraph(keep_entities=False)
+        graph.add(pyqremis.Relationship.from_dict(relationship))
+        self.assertEqual(graph.kind(agent1), 'agent')
+        o = make_object_dict(1)
+        o['objectIdentifier'].append(
+            {'objectIdentifierType': 'uuid', 'objectIdentifierValue': 'alias1'}
+        )
+        d = make_record_dict(3)
+        d['qremis']['object'][1] = o
+        graph.add(pyqremis.QremisRoot.from_dict(d))
+        self.assertIn(alias1, graph)
+        self.assertEqual(graph.linked(alias1, kind='agent'), [agent1])
+        self.assertEqual(sorted(graph.linked(obj1)), [agent1, evt1, obj2])
+        self.assertEqual(graph.path(evt1, evt2), [
+            evt1, rel1, obj1, ('relationship', 'uuid', 'rel9'),
+            obj2, ('relationship', 'uuid', 'rel2'), evt2
+        ])
+        self.assertIsNone(graph.path(evt1, evt2, max_depth=4))
+        with self.assertRaises(KeyError):
+            graph.entity(obj1)
+        with self.assertRaises(TypeError):
+            graph.add(pyqremis.Fixity(messageDigest='a', messageDigestAlgorithm='b'))
+        # An object and an event which share an identifier are different nodes
+        d = make_record_dict(2)
+        shared = {'eventIdentifierType': 'uuid', 'eventIdentifierValue': 'obj0'}
+        d['qremis']['event'][1]['eventIdentifier'] = [shared]
+        d['qremis']['relationship'][1]['linkingEventIdentifier'] = [
+            {'linkingEventIdentifierType': 'uuid', 'linkingEventIdentifierValue': 'obj0'}
+        ]
+        qremis = pyqremis.QremisRoot.from_dict(d).get_qremis()
+        graph = RelationshipGraph([qremis])
+        self.assertEqual(len(graph), 6)
+        self.assertIs(graph.entity(('object', 'uuid', 'obj0')), qremis.get_object()[0])
+        self.assertIs(graph.entity(('event', 'uuid', 'obj0')), qremis.get_event()[1])
+        self.assertEqual(graph.linked(('object', 'uuid', 'obj0')), [('event', 'uuid', 'evt0')])
+        self.assertEqual(graph.linked(('event', 'uuid', 'obj0')), [('object', 'uuid', 'obj1')])
+
+    def testValueIndex(self):
+        from pyqremis.index import ValueIndex
+        digest = 'objectCharacteristics.fixity.messageDigest'
+        root = pyqremis.QremisRoot.from_dict(make_record_dict(4))
+        objects = root.get_qremis().get_object()
+        index = ValueIndex(['object.' + digest, 'event.eventType'], [root])
+        # make_object_dict's digests repeat every three objects
+        self.assertEqual(index.lookup('object.' + digest, 'digest0'), [objects[0], objects[3]])
+        self.assertEqual(index.lookup('object.' + digest, 'nothing'), [])
+        self.assertEqual(
+            sorted(index.values('object.' + digest)), ['digest0', 'digest1', 'digest2']
+        )
+        self.assertEqual(len(index.lookup('event.eventType', 'ingest')), 4)
+        self.assertEqual(
+            list(index.shared('object.' + digest)), [('digest0', [objects[0], objects[3]])]
+        )
+        # Added to incrementally, one entity at a time
+        o = pyqremis.Object.from_dict(make_object_dict(1))
+        index.add(o)
+        self.assertEqual(index.lookup('object.' + digest, 'digest1'), [objects[1], o])
+        # Identifiers rather than elements
+        index = ValueIndex(['object.' + digest], [root, root.get_qremis()], keep_entities=False)
+        self.assertEqual(
+            index.lookup('object.' + digest, 'digest2'), [('uuid', 'obj2'), ('uuid', 'obj2')]
+        )
+        for path in ('thing.eventType', 'event.eventTypo', 'event.eventOutcomeInformation',
+                     'event.eventType.more', 'object.objectExtension.a'):
+            with self.assertRaises(ValueError):
+                ValueIndex([path])
+        with self.assertRaises(TypeError):
+            index.add(pyqremis.Fixity(messageDigest='a', messageDigestAlgorithm='b'))
+        # Without identifiers, there's nothing to stand in for the entity
+        anonymous = pyqremis.Object.from_dict(make_object_dict(0))
+        anonymous.del_objectIdentifier()
+        before = index.lookup('object.' + digest, 'digest0')
+        with self.assertRaises(ValueError):
+            index.add(anonymous)
+        self.assertEqual(index.lookup('object.' + digest, 'digest0'), before)
+        index = ValueIndex(['object.' + digest], [anonymous])
+        self.assertEqual(index.lookup('object.' + digest, 'digest0'), [anonymous])
+
+    def testQuery(self):
+        from pyqremis.query import Query, select
+        d = make_record_dict(3)
+        root = pyqremis.QremisRoot.from_dict(d)
+        qremis = root.get_qremis()
+        query = Query('object[*].storage[*].contentLocation.contentLocationValue')
+        self.assertIs(query.result_type, str)
+        expected = ['/data/0', '/data/1', '/data/2']
+        self.assertEqual(list(query(qremis)), expected)
+        self.assertEqual(list(query(d['qremis'])), expected)
+        self.assertEqual(list(query(pyqremis.Qremis.from_dict(d['qremis'], lazy=True))), expected)
+        # No subscript is the same as [*]
+        self.assertEqual(
+            list(select('object.storage.contentLocation.contentLocationValue', qremis)), expected
+        )
+        self.assertEqual(list(select('object[-1].objectIdentifier[0]', qremis)),
+                         [qremis.get_object()[2].get_objectIdentifier()[0]])
+        self.assertEqual(list(select('object[3]', qremis)), [])
+        self.assertEqual(list(select('object[1].originalName', qremis)), [])
+        self.assertEqual(
+            list(select('qremis.event.eventType', d, cls=pyqremis.QremisRoot)), ['ingest'] * 3
+        )
+        self.assertEqual(list(select('', qremis)), [qremis])
+        for path in ('object[*].storage[*].nothing', 'object[x]', 'object.objectCategory[0]',
+                     'object.objectCategory.more', 'object.objectExtension.a'):
+            with self.assertRaises(ValueError):
+                Query(path)
+        with self.assertRaises(TypeError):
+            query(root)
+
+    def testMerge(self):
+        from pyqremis.merge import merge
+        a = make_record_dict(3)
+        b = make_record_dict(4)
+        # obj1 again, with another identifier and a second storage location
+        o = b['qremis']['object'][1]
+        o['objectIdentifier'].append(
+            {'objectIdentifierType': 'local', 'objectIdentifierValue': 'x'}
+        )
+        o['storage'].append({'storageMedium': 'tape'})
+        o['originalName'] = 'first wins'
+        # Only known by the other identifier, and bridging to obj2
+        c = {'qremis': {'object': [make_object_dict(2)]}}
+        c['qremis']['object'][0]['objectIdentifier'].append(
+            {'objectIdentifierType': 'local', 'objectIdentifierValue': 'x'}
+        )
+        records = [pyqremis.QremisRoot.from_dict(x) for x in (a, b, c)]
+        before = [x.to_dict() for x in records]
+        for spill in (False, True):
+            merged = merge(records, spill=spill, buckets=3)
+            self.assertEqual([x.to_dict() for x in records], before)
+            self.assertEqual(len(merged.get_event()), 4)
+            self.assertEqual(len(merged.get_relationship()), 4)
+            objects = merged.get_object()
+            self.assertEqual(len(objects), 3)
+            by_id = dict(
+                (x.get_objectIdentifier()[0].get_objectIdentifierValue(), x) for x in objects
+            )
+            self.assertEqual(sorted(by_id), ['obj0', 'obj1', 'obj3'])
+            obj1 = by_id['obj1']
+            self.assertEqual(
+                sorted(x.get_objectIdentifierValue() for x in obj1.get_objectIdentifier()),
+                ['obj1', 'obj2', 'x']
+            )
+            self.assertEqual(len(obj1.get_storage()), 3)
+            self.assertEqual(obj1.get_originalName(), 'first wins')
+            self.assertEqual(merged.validate(), [])
+        self.assertEqual(merge([records[0]]).to_dict(), a['qremis'])
+
+    def testMergeJoinsGroups(self):
+        from pyqremis.merge import merge, _Groups
+        groups = _Groups()
+        for x in "abcde":
+            groups.add([x])
+        # Each join hangs the previous root under the oldest group, so the
+        # chain gets longer and finding from its end has to compress it
+        self.assertEqual(groups.add(["d", "e"]), (3, [4]))
+        self.assertEqual(groups.add(["c", "e"]), (2, [3]))
+        self.assertEqual(groups.add(["b", "e"]), (1, [2]))
+        self.assertEqual(groups.add(["a", "e"]), (0, [1]))
+        for i in range(5):
+            self.assertEqual(groups.find(i), 0)
+            self.assertEqual(groups.find(i), 0)
+
+        def make_object(*identifiers):
+            d = make_object_dict(0)
+            d['objectIdentifier'] = [
+                {'objectIdentifierType': 'local', 'objectIdentifierValue': x}
+                for x in identifiers
+            ]
+            d['originalName'] = identifiers[0]
+            return d
+        objects = [make_object(x) for x in "abcd"]
+        # Bridges b-c, then a-b and c-d, then a-d, joining everything
+        for x, y in (("b", "c"), ("a", "b"), ("c", "d"), ("a", "d")):
+            objects.append(make_object(x, y))
+        records = [pyqremis.Qremis.from_dict({'object': [x]}) for x in objects]
+        for spill in (False, True):
+            merged = merge(records, spill=spill, buckets=2).get_object()
+            self.assertEqual(len(merged), 1)
+            self.assertEqual(merged[0].get_originalName(), 'a')
+            self.assertEqual(
+                sorted(x.get_objectIdentifierValue() for x in merged[0].get_objectIdentifier()),
+                list("abcd")
+            )
+
+    def testDiff(self):
+        import json
+        from unittest import mock
+        from pyqremis.diff import diff, patch
+        a_dict = make_record_dict(6)['qremis']
+        b_dict = make_record_dict(6)['qremis']
+        objects = b_dict['object']
+        objects[1]['originalName'] = 'renamed'
+        objects[2]['storage'][0]['contentLocation']['contentLocationValue'] = '/moved'
+        objects[3]['storage'].insert(0, {'storageMedium': 'tape'})
+        objects[4]['objectCharacteristics'][0]['objectCharacteristicsExtension'] = [
+            {'note': ['changed']}
+        ]
+        del objects[5]['linkingRelationshipIdentifier']
+        del b_dict['event'][2]
+        b_dict['relationship'].append(make_relationship_dict(9))
+        a = pyqremis.Qremis.from_dict(a_dict)
+        b = pyqremis.Qremis.from_dict(b_dict)
+        # Which entity kind comes first follows _spec order, which isn't fixed
+        # before Python 3.6, so only the ops are checked, not their order
+        ops = diff(a, b)
+        self.assertIn(("delete", "event[2]"), ops)
+        self.assertIn(("add", "relationship[6]", make_relationship_dict(9)), ops)
+        self.assertIn(("set", "object[1].originalName", "renamed"), ops)
+        self.assertIn(
+            ("set", "object[2].storage[0].contentLocation.contentLocationValue", "/moved"), ops
+        )
+        self.assertIn(("add", "object[3].storage[0]", {'storageMedium': 'tape'}), ops)
+        self.assertIn(("delete", "object[5].linkingRelationshipIdentifier"), ops)
+        self.assertEqual(len(ops), 7)
+        self.assertEqual(patch(a, ops), b)
+        self.assertEqual(a.to_dict(), b_dict)
+        self.assertEqual(a.validate(), [])
+        self.assertEqual(diff(a, b), [])
+        # Through JSON, and the other way
+        a = pyqremis.Qremis.from_dict(make_record_dict(6)['qremis'])
+        self.assertEqual(patch(b, json.loads(json.dumps(diff(b, a)))), a)
+        # Reordering repeatable values isn't invisible, as it is to fingerprints
+        c_dict = make_record_dict(6)['qremis']
+        c_dict['object'].reverse()
+        c = pyqremis.Qremis.from_dict(c_dict)
+        self.assertEqual(a.fingerprint(), c.fingerprint())
+        self.assertEqual(patch(a, diff(a, c)), c)
+        with self.assertRaises(TypeError):
+            diff(a, a.get_object()[0])
+        with self.assertRaises(ValueError):
+            patch(a, [("set", "object.originalName", "x")])
+        with self.assertRaises(ValueError):
+            patch(a, [("move", "object[0]")])
+        with self.assertRaises(TypeError):
+            patch(a, [("set", "object[0].originalName", 1)])
+
+        # Once both sides have been digested, a change costs its own subtree
+        # and the elements above it, not the size of the trees
+        a = pyqremis.Qremis.from_dict(make_record_dict(50)['qremis'])
+        b = pyqremis.Qremis.from_dict(make_record_dict(50)['qremis'])
+        self.assertEqual(diff(a, b), [])
+        b.get_object()[40].get_storage()[0].set_storageMedium('tape')
+        calls = []
+        iter_fields = pyqremis.QremisElement._iter_fields
+
+        def counting(self):
+            calls.append(self)
+            return iter_fields(self)
+        with mock.patch.object(pyqremis.QremisElement, '_iter_fields', counting):
+            ops = diff(a, b)
+        self.assertEqual(ops, [("set", "object[40].storage[0].storageMedium", "tape")])
+        # The changed storage, object and qremis, digested on b and compared
+        # on both sides
+        self.assertLessEqual(len(calls), 9)
+
 
 if __name__ == "__main__":
     unittest.main()